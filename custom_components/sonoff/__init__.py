@@ -1,9 +1,11 @@
 import asyncio
 import logging
+import time
+from datetime import timedelta
 
 import voluptuous as vol
 from homeassistant.components import zeroconf
-from homeassistant.config_entries import ConfigEntry, SOURCE_IMPORT
+from homeassistant.config_entries import ConfigEntry, ConfigEntryState, SOURCE_IMPORT
 from homeassistant.const import (
     CONF_DEVICES,
     CONF_DEVICE_CLASS,
@@ -22,6 +24,7 @@ from homeassistant.core import HomeAssistant, ServiceCall
 from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.device_registry import async_get as device_registry
+from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.helpers.storage import Store
 
 from . import system_health
@@ -29,15 +32,31 @@ from .core import devices as core_devices
 from .core.const import (
     CONF_APPID,
     CONF_APPSECRET,
+    CONF_CACHE_FIRST,
+    CONF_CLOUD_BURST,
+    CONF_CLOUD_PAGE,
+    CONF_CLOUD_RATE,
+    CONF_COALESCE,
     CONF_COUNTRY_CODE,
     CONF_DEFAULT_CLASS,
     CONF_DEVICEKEY,
+    CONF_DISCOVERY,
+    CONF_HEDGED,
+    CONF_KEEPALIVE,
     CONF_RFBRIDGE,
     DOMAIN,
 )
-from .core.ewelink import SIGNAL_ADD_ENTITIES, SIGNAL_CONNECTED, XRegistry
+from .core.entity import XEntity, XStateWriter
+from .core.ewelink import (
+    SIGNAL_ADD_ENTITIES,
+    SIGNAL_CONNECTED,
+    SIGNAL_HOSTS,
+    XRegistry,
+    XRegistryLocal,
+)
 from .core.ewelink.camera import XCameras
-from .core.ewelink.cloud import APP, AuthError
+from .core.ewelink.cloud import APP, AuthError, XRegistryCloud
+from .core.ewelink.discovery import discovery_hosts
 from .core.xutils import create_clientsession
 
 _LOGGER = logging.getLogger(__name__)
@@ -69,6 +88,18 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Optional(CONF_USERNAME): cv.string,
                 vol.Optional(CONF_PASSWORD): cv.string,
                 vol.Optional(CONF_DEFAULT_CLASS): cv.string,
+                vol.Optional(CONF_CACHE_FIRST): cv.boolean,
+                vol.Optional(CONF_COALESCE): cv.positive_float,
+                vol.Optional(CONF_CLOUD_RATE): vol.All(
+                    vol.Coerce(float), vol.Range(min=0, min_included=False)
+                ),
+                vol.Optional(CONF_CLOUD_BURST): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+                vol.Optional(CONF_CLOUD_PAGE): cv.positive_int,
+                vol.Optional(CONF_DISCOVERY): vol.All(cv.ensure_list, [cv.string]),
+                vol.Optional(CONF_HEDGED): cv.boolean,
+                vol.Optional(CONF_KEEPALIVE): cv.boolean,
                 vol.Optional(CONF_SENSORS): cv.ensure_list,
                 vol.Optional(CONF_RFBRIDGE): {
                     cv.string: vol.Schema(
@@ -99,6 +130,14 @@ CONFIG_SCHEMA = vol.Schema(
 )
 
 UNIQUE_DEVICES = {}
+# deviceid => number of syncs in a row without this device in cloud list
+MISSING_DEVICES: dict[str, int] = {}
+# entry_id => loaded platforms
+LOADED_PLATFORMS: dict[str, list] = {}
+
+SYNC_INTERVAL = timedelta(hours=1)
+SYNC_MISSING = 3  # remove device after this number of syncs without it
+DISCOVERY_INTERVAL = timedelta(minutes=10)
 
 
 async def async_setup(hass: HomeAssistant, config: dict) -> bool:
@@ -120,6 +159,18 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
             core_devices.get_spec = core_devices.get_spec_wrapper(
                 core_devices.get_spec, conf.get(CONF_SENSORS)
             )
+        if conf.get(CONF_HEDGED):
+            XRegistry.hedged = True
+        if conf.get(CONF_KEEPALIVE):
+            XRegistryLocal.keepalive = True
+        if CONF_COALESCE in conf:
+            XEntity.writer = XStateWriter(conf[CONF_COALESCE])
+        if CONF_CLOUD_RATE in conf:
+            XRegistryCloud.rate = conf[CONF_CLOUD_RATE]
+        if CONF_CLOUD_BURST in conf:
+            XRegistryCloud.burst = conf[CONF_CLOUD_BURST]
+        if CONF_CLOUD_PAGE in conf:
+            XRegistryCloud.get_devices_page = conf[CONF_CLOUD_PAGE]
 
     # cameras starts only on first command to it
     cameras = XCameras()
@@ -212,17 +263,18 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     mode = config_entry.options.get(CONF_MODE, "auto")
     data = config_entry.data
 
+    store = Store(hass, 1, f"{DOMAIN}/{config_entry.data['username']}.json")
+
+    if XRegistry.config and XRegistry.config.get(CONF_CACHE_FIRST):
+        if devices := await store.async_load():
+            _LOGGER.debug(f"{len(devices)} devices loaded from Cache")
+            await internal_setup_cached(hass, config_entry, store, devices)
+            return True
+
     # if has cloud password and not auth
     if not registry.cloud.auth and data.get(CONF_PASSWORD):
         try:
-            _LOGGER.debug(f"Login to cloud with APPID {APP[0][:4]}...")
-            await registry.cloud.login(**data)
-            # store country_code for future requests optimisation
-            if not data.get(CONF_COUNTRY_CODE):
-                hass.config_entries.async_update_entry(
-                    config_entry,
-                    data={**data, CONF_COUNTRY_CODE: registry.cloud.country_code},
-                )
+            await internal_login(hass, config_entry)
         except Exception as e:
             _LOGGER.warning(f"Can't login in {mode} mode: {repr(e)}")
             if mode == "cloud":
@@ -238,11 +290,7 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
         hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, registry.stop)
     )
 
-    # important to run before registry.setup_devices (for remote childs)
-    await hass.config_entries.async_forward_entry_setups(config_entry, PLATFORMS)
-
     devices: list[dict] | None = None
-    store = Store(hass, 1, f"{DOMAIN}/{config_entry.data['username']}.json")
 
     # if auth OK - load devices from cloud
     if registry.cloud.auth:
@@ -252,7 +300,7 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
             _LOGGER.debug(f"{len(devices)} devices loaded from Cloud")
 
             # store devices to cache
-            await store.async_save(devices)
+            await internal_save_devices(store, devices)
 
         except Exception as e:
             _LOGGER.warning("Can't load devices", exc_info=e)
@@ -262,8 +310,13 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
             _LOGGER.debug(f"{len(devices)} devices loaded from Cache")
 
     if devices:
-        # we need to setup_devices before local.start
         devices = internal_unique_devices(config_entry.entry_id, devices)
+
+    # important to run before registry.setup_devices (for remote childs)
+    await internal_forward_platforms(hass, config_entry, devices)
+
+    if devices:
+        # we need to setup_devices before local.start
         entities = registry.setup_devices(devices)
     else:
         entities = None
@@ -271,8 +324,11 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     if mode in ("auto", "cloud") and config_entry.data.get(CONF_PASSWORD):
         registry.cloud.start(**config_entry.data)
 
+    if config_entry.data.get(CONF_PASSWORD):
+        internal_track_devices(hass, config_entry, store)
+
     if mode in ("auto", "local"):
-        registry.local.start(await zeroconf.async_get_instance(hass))
+        await internal_local_start(hass, config_entry)
 
     _LOGGER.debug(mode.upper() + " mode start")
 
@@ -296,12 +352,317 @@ async def async_setup_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> b
     return True
 
 
+async def internal_login(hass: HomeAssistant, config_entry: ConfigEntry):
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+    data = config_entry.data
+
+    _LOGGER.debug(f"Login to cloud with APPID {APP[0][:4]}...")
+    await registry.cloud.login(**data)
+    # store country_code for future requests optimisation
+    if not data.get(CONF_COUNTRY_CODE):
+        hass.config_entries.async_update_entry(
+            config_entry,
+            data={**data, CONF_COUNTRY_CODE: registry.cloud.country_code},
+        )
+
+
+async def internal_setup_cached(
+    hass: HomeAssistant, config_entry: ConfigEntry, store: Store, devices: list
+):
+    """Setup entities from cached devices list without waiting cloud. Cloud
+    login and devices list update run in the background.
+    """
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+
+    mode = config_entry.options.get(CONF_MODE, "auto")
+    data = config_entry.data
+
+    config_entry.async_on_unload(
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, registry.stop)
+    )
+
+    devices = internal_unique_devices(config_entry.entry_id, devices)
+
+    await internal_forward_platforms(hass, config_entry, devices)
+
+    entities = registry.setup_devices(devices)
+
+    if mode in ("auto", "local"):
+        await internal_local_start(hass, config_entry)
+
+    _LOGGER.debug(mode.upper() + " mode start from Cache")
+
+    _LOGGER.debug(f"Add {len(entities)} entities")
+    registry.dispatcher_send(SIGNAL_ADD_ENTITIES, entities)
+
+    if not data.get(CONF_PASSWORD):
+        if not config_entry.update_listeners:
+            config_entry.add_update_listener(async_update_options)
+        return
+
+    async def cloud_sync():
+        if not registry.cloud.auth:
+            try:
+                await internal_login(hass, config_entry)
+            except Exception as e:
+                _LOGGER.warning(f"Can't login in {mode} mode: {repr(e)}")
+                if mode == "cloud" and isinstance(e, AuthError):
+                    # same as ConfigEntryAuthFailed on usual setup
+                    config_entry.async_start_reauth(hass)
+
+        # after login, because new country_code in entry data will reload it
+        if not config_entry.update_listeners:
+            config_entry.add_update_listener(async_update_options)
+
+        if registry.cloud.auth:
+            try:
+                await internal_sync_devices(hass, config_entry, store)
+            except Exception as e:
+                _LOGGER.warning(f"Can't update devices from Cloud: {repr(e)}")
+
+        if mode in ("auto", "cloud"):
+            registry.cloud.start(**config_entry.data)
+
+    task = asyncio.create_task(cloud_sync())
+    config_entry.async_on_unload(task.cancel)
+
+    internal_track_devices(hass, config_entry, store)
+
+
+async def internal_forward_platforms(
+    hass: HomeAssistant, config_entry: ConfigEntry, devices: list | None
+):
+    """Load only platforms, that are needed for devices. Other platforms will be
+    loaded later, when some new device (from cloud sync or LAN) needs them.
+    """
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+
+    config = XRegistry.config.get(CONF_DEVICES) if XRegistry.config else None
+    platforms = set(core_devices.BASE_PLATFORMS)
+    for device in devices or []:
+        try:
+            if config and device["deviceid"] in config:
+                device = {**device, **config[device["deviceid"]]}
+            platforms |= core_devices.get_platforms(device)
+        except Exception as e:
+            _LOGGER.debug(f"Can't get platforms for {device}", exc_info=e)
+
+    # keep order from PLATFORMS, it is important to have the `sensor` first
+    platforms = [i for i in PLATFORMS if i in platforms]
+    LOADED_PLATFORMS[config_entry.entry_id] = platforms
+
+    ts = time.perf_counter()
+    await hass.config_entries.async_forward_entry_setups(config_entry, platforms)
+    ts = time.perf_counter() - ts
+    _LOGGER.debug(f"Load platforms: {platforms} in {ts * 1000:.0f}ms")
+
+    # platform => entities waiting for platform loading
+    pending: dict[str, list] = {}
+
+    async def forward(platform: str):
+        ts = time.perf_counter()
+        if (MAJOR_VERSION, MINOR_VERSION) >= (2024, 3):
+            # wait for entry setup (or reload) to finish
+            async with config_entry.setup_lock:
+                if config_entry.state is not ConfigEntryState.LOADED:
+                    pending.pop(platform)
+                    return
+                await hass.config_entries.async_forward_entry_setups(
+                    config_entry, [platform]
+                )
+        else:
+            await hass.config_entries.async_forward_entry_setups(
+                config_entry, [platform]
+            )
+        ts = time.perf_counter() - ts
+        # platform module can be imported before, by new entities classes
+        imp = core_devices.IMPORT_TIMES.pop(platform, 0)
+        _LOGGER.debug(
+            f"Load platform {platform} in {ts * 1000:.0f}ms, import {imp * 1000:.0f}ms"
+        )
+        registry.dispatcher_send(SIGNAL_ADD_ENTITIES, pending.pop(platform))
+
+    def add_entities(entities: list):
+        for entity in entities:
+            platform = core_devices.get_platform(type(entity))
+            if platform in pending:
+                # platform is loading right now
+                pending[platform].append(entity)
+            elif platform not in platforms and platform in PLATFORMS:
+                _LOGGER.debug(f"Load platform {platform} for new entities")
+                # mark as loaded before loading, so it will be unloaded with entry
+                platforms.append(platform)
+                pending[platform] = [entity]
+                task = asyncio.create_task(forward(platform))
+                config_entry.async_on_unload(task.cancel)
+
+    config_entry.async_on_unload(
+        registry.dispatcher_connect(SIGNAL_ADD_ENTITIES, add_entities)
+    )
+
+
+async def internal_local_start(hass: HomeAssistant, config_entry: ConfigEntry):
+    """Start LAN discovery and check cached hosts without waiting zeroconf."""
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+    registry.local.start(await zeroconf.async_get_instance(hass))
+
+    store = Store(hass, 1, f"{DOMAIN}/{config_entry.data['username']}_hosts.json")
+
+    def save_hosts():
+        # save hosts snapshot, because registry can be stopped before delayed save
+        hosts = registry.local_hosts()
+        store.async_delay_save(lambda: hosts, 10)
+
+    config_entry.async_on_unload(registry.dispatcher_connect(SIGNAL_HOSTS, save_hosts))
+
+    hosts = await store.async_load()
+    if hosts:
+        task = asyncio.create_task(registry.probe_hosts(hosts))
+        config_entry.async_on_unload(task.cancel)
+
+    if XRegistry.config and CONF_DISCOVERY in XRegistry.config:
+        items = XRegistry.config[CONF_DISCOVERY]
+
+        async def discover(now=None):
+            # cached hosts can change their address, so check them first
+            known = [i["host"] for i in (await store.async_load() or {}).values()]
+            found = await hass.async_add_executor_job(discovery_hosts, items)
+            try:
+                await registry.discover(list(dict.fromkeys(known + found)))
+            except Exception as e:
+                _LOGGER.warning(f"Can't run LAN discovery: {repr(e)}")
+
+        task = asyncio.create_task(discover())
+        config_entry.async_on_unload(task.cancel)
+        config_entry.async_on_unload(
+            async_track_time_interval(hass, discover, DISCOVERY_INTERVAL)
+        )
+
+
+def internal_devices_diff(old: list, new: list) -> tuple[set, set, set]:
+    """Return added, removed and changed deviceids. Params are not compared,
+    because they are changed all the time.
+    """
+    old = {i["deviceid"]: {k: v for k, v in i.items() if k != "params"} for i in old}
+    new = {i["deviceid"]: {k: v for k, v in i.items() if k != "params"} for i in new}
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {k for k in new.keys() & old.keys() if new[k] != old[k]}
+    return added, removed, changed
+
+
+def internal_devices_params(devices: list) -> dict:
+    return {i["deviceid"]: i.get("params") for i in devices}
+
+
+def internal_devices_missing(old: list, new: list) -> list:
+    """Return devices from old list that are missing in new list."""
+    deviceids = {i["deviceid"] for i in new}
+    return [i for i in old if i["deviceid"] not in deviceids]
+
+
+async def internal_save_devices(store: Store, devices: list) -> tuple[set, set, set]:
+    """Save devices to cache only if something was changed. Cloud can return
+    incomplete list, so device is removed only after several syncs without it.
+    """
+    if not devices:
+        return set(), set(), set()
+
+    cache = await store.async_load() or []
+
+    for did in {i["deviceid"] for i in devices}:
+        MISSING_DEVICES.pop(did, None)
+
+    devices = devices.copy()
+    for device in internal_devices_missing(cache, devices):
+        did = device["deviceid"]
+        MISSING_DEVICES[did] = MISSING_DEVICES.get(did, 0) + 1
+        if MISSING_DEVICES[did] < SYNC_MISSING:
+            _LOGGER.debug(f"{did} !! device missing in Cloud")
+            devices.append(device)  # keep in cache for now
+        else:
+            MISSING_DEVICES.pop(did)
+
+    diff = internal_devices_diff(cache, devices)
+    if any(diff):
+        _LOGGER.debug("Save devices to Cache: %s added, %s removed, %s changed", *diff)
+        await store.async_save(devices)
+    elif internal_devices_params(cache) != internal_devices_params(devices):
+        # params are changed all the time, so save them without hurry,
+        # copy because sync_devices will pop params from the list
+        data = [i.copy() for i in devices]
+        store.async_delay_save(lambda: data, 60)
+    return diff
+
+
+async def internal_sync_devices(
+    hass: HomeAssistant, config_entry: ConfigEntry, store: Store
+):
+    """Load devices from cloud and apply changes to running registry without
+    integration reload.
+    """
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+
+    homes = config_entry.options.get("homes")
+    devices = await registry.cloud.get_devices(homes)
+    _LOGGER.debug(f"{len(devices)} devices loaded from Cloud")
+
+    if not devices:
+        _LOGGER.warning("Empty devices list from Cloud, skip sync")
+        return
+
+    _, removed, changed = await internal_save_devices(store, devices)
+
+    dr = device_registry(hass)
+
+    for did in removed:
+        if not registry.remove_device(did):
+            continue
+        UNIQUE_DEVICES.pop(did, None)
+        if entry := dr.async_get_device(identifiers={(DOMAIN, did)}):
+            _LOGGER.warning(f"{did} !! device removed from Cloud")
+            # entities will be removed with device and disconnect from registry
+            dr.async_remove_device(entry.id)
+
+    devices = internal_unique_devices(config_entry.entry_id, devices)
+    mode = config_entry.options.get(CONF_MODE, "auto")
+    if entities := registry.sync_devices(devices, mode != "local"):
+        _LOGGER.debug(f"Add {len(entities)} entities")
+        registry.dispatcher_send(SIGNAL_ADD_ENTITIES, entities)
+
+    for did in changed:
+        device = registry.devices.get(did)
+        entry = dr.async_get_device(identifiers={(DOMAIN, did)})
+        if device and entry and entry.name != device["name"]:
+            dr.async_update_device(entry.id, name=device["name"])
+
+
+def internal_track_devices(
+    hass: HomeAssistant, config_entry: ConfigEntry, store: Store
+):
+    """Periodically sync devices list with cloud in the background."""
+    registry: XRegistry = hass.data[DOMAIN][config_entry.entry_id]
+
+    async def sync(now):
+        if not registry.cloud.auth:
+            return
+        try:
+            await internal_sync_devices(hass, config_entry, store)
+        except Exception as e:
+            _LOGGER.warning(f"Can't sync devices with Cloud: {repr(e)}")
+
+    config_entry.async_on_unload(
+        async_track_time_interval(hass, sync, SYNC_INTERVAL)
+    )
+
+
 async def async_update_options(hass: HomeAssistant, entry: ConfigEntry):
     await hass.config_entries.async_reload(entry.entry_id)
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
-    ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    platforms = LOADED_PLATFORMS.pop(entry.entry_id, PLATFORMS)
+    ok = await hass.config_entries.async_unload_platforms(entry, platforms)
 
     registry: XRegistry = hass.data[DOMAIN][entry.entry_id]
     await registry.stop()
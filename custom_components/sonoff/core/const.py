@@ -3,8 +3,16 @@ DOMAIN = "sonoff"
 CONF_APPID = "appid"
 CONF_APPSECRET = "appsecret"
 CONF_DEBUG = "debug"
+CONF_CACHE_FIRST = "cache_first"
+CONF_CLOUD_BURST = "cloud_burst"
+CONF_CLOUD_PAGE = "cloud_page"
+CONF_CLOUD_RATE = "cloud_rate"
+CONF_COALESCE = "coalesce"
 CONF_DEFAULT_CLASS = "default_class"
 CONF_DEVICEKEY = "devicekey"
+CONF_DISCOVERY = "discovery"
+CONF_HEDGED = "hedged"
+CONF_KEEPALIVE = "keepalive"
 CONF_RFBRIDGE = "rfbridge"
 CONF_COUNTRY_CODE = "country_code"
 
@@ -10,15 +10,20 @@ XEntity properties:
 - uid - optional, entity unique_id tail
 
 Developer can change global properties of existing classes via spec function.
+Classes for DEVICES list are created on first use via lazy function. Classes
+from rare platforms are referenced by name, so their modules (and Hass
+components) are loaded only when some device uses them.
 """
 
+import importlib.util
+import sys
+import time
+
 from homeassistant.components.binary_sensor import BinarySensorEntity
-from homeassistant.components.light import ColorMode, LightEntity
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.components.switch import SwitchEntity
 
 from .ewelink import XDevice
-from ..alarm_control_panel import XPanelAlarm
 from ..binary_sensor import (
     XBinarySensor,
     XHumanSensor,
@@ -28,35 +33,7 @@ from ..binary_sensor import (
     XZigbeeMotion,
 )
 from ..button import XButton, XT5Effect
-from ..climate import XClimateNS, XClimateTH, XThermostat, XThermostatTRVZB
 from ..core.entity import XEntity
-from ..cover import XCover, XCoverDualR3, XCoverOP, XCoverT5, XZBCover, XZigbeeCover
-from ..fan import XDiffuserFan, XFan, XFan17, XFanDualR3, XToggleFan
-from ..light import (
-    XDiffuserLight,
-    XDimmer,
-    XFanLight,
-    XLight57,
-    XLightB02,
-    XLightB05B,
-    XLightB1,
-    XLightD1,
-    XLightGroup,
-    XLightL1,
-    XLightL3,
-    XMiniDim,
-    XOnOffLight,
-    XT5EffectLight,
-    XT5EffectSound,
-    XT5EffectStatus,
-    XT5Light,
-    XZigbeeColorTemp,
-    XZigbeeLight,
-)
-from ..media_player import XPanelBuzzer
-from ..number import XPulseWidth, XSensitivity, XTempCorrectionNumber
-from ..remote import XRemote
-from ..select import XSelectStartup, XStartup
 from ..sensor import (
     XButtonKey,
     XButtonLocalKey,
@@ -91,6 +68,143 @@ from ..switch import (
     XZigbeeSwitches,
 )
 
+# platforms for entities of any device, can't be loaded later
+BASE_PLATFORMS = {"binary_sensor", "button", "sensor", "switch"}
+# platform => import time of platform module, for debug logs
+IMPORT_TIMES: dict[str, float] = {}
+
+
+class LazySpec:
+    """Class from platform module or arguments for spec function. Class is
+    created (and platform module is imported) on first use.
+    """
+
+    __slots__ = ("cls", "kwargs")
+
+    def __init__(self, cls, kwargs: dict | None):
+        self.cls = cls
+        self.kwargs = kwargs
+
+    @property
+    def platform(self) -> str | None:
+        if isinstance(self.cls, str):
+            return self.cls.split(".")[0]
+        return get_platform(self.cls)
+
+    def resolve(self) -> type:
+        if isinstance(self.cls, str):
+            module, name = self.cls.split(".")
+            cls = getattr(import_platform(module), name)
+        else:
+            cls = self.cls
+        return spec(cls, **self.kwargs) if self.kwargs is not None else cls
+
+
+def import_platform(platform: str):
+    """Import platform module and save its import time."""
+    name = importlib.util.resolve_name(f"..{platform}", __package__)
+    if module := sys.modules.get(name):
+        return module
+
+    ts = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[platform] = time.perf_counter() - ts
+    return module
+
+
+def ref(platform: str, *names: str) -> list[LazySpec]:
+    """Reference classes from platform module without importing it."""
+    return [LazySpec(f"{platform}.{name}", None) for name in names]
+
+
+def lazy(cls, **kwargs) -> LazySpec:
+    """Same as spec, but class is created only when some device uses it. Most
+    users have only a few UIIDs from the DEVICES list.
+    """
+    return LazySpec(cls, kwargs)
+
+
+def resolve_spec(classes: list) -> list:
+    if any(isinstance(cls, LazySpec) for cls in classes):
+        return [cls.resolve() if isinstance(cls, LazySpec) else cls for cls in classes]
+    return classes
+
+
+def get_platform(cls) -> str | None:
+    """Return Hass platform (domain) of entity class by its Hass base class."""
+    if isinstance(cls, LazySpec):
+        return cls.platform
+    for base in cls.__mro__:
+        if base.__module__.startswith("homeassistant.components."):
+            return base.__module__.split(".")[2]
+    return None
+
+
+(XPanelAlarm,) = ref("alarm_control_panel", "XPanelAlarm")
+XClimateNS, XClimateTH, XThermostat, XThermostatTRVZB = ref(
+    "climate", "XClimateNS", "XClimateTH", "XThermostat", "XThermostatTRVZB"
+)
+XCover, XCoverDualR3, XCoverOP, XCoverT5, XZBCover, XZigbeeCover = ref(
+    "cover",
+    "XCover",
+    "XCoverDualR3",
+    "XCoverOP",
+    "XCoverT5",
+    "XZBCover",
+    "XZigbeeCover",
+)
+XDiffuserFan, XFan, XFan17, XFanDualR3, XToggleFan = ref(
+    "fan", "XDiffuserFan", "XFan", "XFan17", "XFanDualR3", "XToggleFan"
+)
+(
+    XDiffuserLight,
+    XDimmer,
+    XFanLight,
+    XLight57,
+    XLightB02,
+    XLightB05B,
+    XLightB1,
+    XLightD1,
+    XLightGroup,
+    XLightL1,
+    XLightL3,
+    XMiniDim,
+    XOnOffLight,
+    XT5EffectLight,
+    XT5EffectSound,
+    XT5EffectStatus,
+    XT5Light,
+    XZigbeeColorTemp,
+    XZigbeeLight,
+) = ref(
+    "light",
+    "XDiffuserLight",
+    "XDimmer",
+    "XFanLight",
+    "XLight57",
+    "XLightB02",
+    "XLightB05B",
+    "XLightB1",
+    "XLightD1",
+    "XLightGroup",
+    "XLightL1",
+    "XLightL3",
+    "XMiniDim",
+    "XOnOffLight",
+    "XT5EffectLight",
+    "XT5EffectSound",
+    "XT5EffectStatus",
+    "XT5Light",
+    "XZigbeeColorTemp",
+    "XZigbeeLight",
+)
+(XPanelBuzzer,) = ref("media_player", "XPanelBuzzer")
+XPulseWidth, XSensitivity, XTempCorrectionNumber = ref(
+    "number", "XPulseWidth", "XSensitivity", "XTempCorrectionNumber"
+)
+(XRemote,) = ref("remote", "XRemote")
+XSelectStartup, XStartup = ref("select", "XSelectStartup", "XStartup")
+
 # supported custom device_class
 DEVICE_CLASS = {
     "binary_sensor": (XEntity, BinarySensorEntity),
@@ -109,39 +223,56 @@ def unwrap_cached_properties(attrs: dict):
     return attrs
 
 
+# spec classes cache: same arguments => same class
+SPEC_CLASSES: dict[tuple, type] = {}
+
+
 def spec(cls, base: str = None, enabled: bool = None, **kwargs) -> type:
     """Make duplicate for cls class with changes in kwargs params.
 
     If `base` param provided - can change Entity base class for cls. So it can
     be added to different Hass domain.
     """
+    if isinstance(cls, LazySpec):
+        cls = cls.resolve()
+
+    # kwargs values can be unhashable (dict, list), but have stable repr
+    key = (cls, base, enabled, repr(sorted(kwargs.items())))
+    if key in SPEC_CLASSES:
+        return SPEC_CLASSES[key]
+
     if enabled is not None:
         kwargs["_attr_entity_registry_enabled_default"] = enabled
     if base:
         attrs = cls.__mro__[-len(XSwitch.__mro__) :: -1]
         attrs = {k: v for b in attrs for k, v in b.__dict__.items()}
         attrs = unwrap_cached_properties({**attrs, **kwargs})
-        return type(cls.__name__, DEVICE_CLASS[base], attrs)
-    return type(cls.__name__, (cls,), kwargs)
+        bases = tuple(resolve_spec(DEVICE_CLASS[base]))
+        new_cls = type(cls.__name__, bases, attrs)
+    else:
+        new_cls = type(cls.__name__, (cls,), kwargs)
 
+    SPEC_CLASSES[key] = new_cls
+    return new_cls
 
-Switch1 = spec(XSwitches, channel=0, uid="1")
-Switch2 = spec(XSwitches, channel=1, uid="2")
-Switch3 = spec(XSwitches, channel=2, uid="3")
-Switch4 = spec(XSwitches, channel=3, uid="4")
 
-Startup1 = spec(XSelectStartup, channel=0, uid="1")
-Startup2 = spec(XSelectStartup, channel=1, uid="2")
-Startup3 = spec(XSelectStartup, channel=2, uid="3")
-Startup4 = spec(XSelectStartup, channel=3, uid="4")
+Switch1 = lazy(XSwitches, channel=0, uid="1")
+Switch2 = lazy(XSwitches, channel=1, uid="2")
+Switch3 = lazy(XSwitches, channel=2, uid="3")
+Switch4 = lazy(XSwitches, channel=3, uid="4")
 
-XSensor100 = spec(XSensor, multiply=0.01, round=2)
+Startup1 = lazy(XSelectStartup, channel=0, uid="1")
+Startup2 = lazy(XSelectStartup, channel=1, uid="2")
+Startup3 = lazy(XSelectStartup, channel=2, uid="3")
+Startup4 = lazy(XSelectStartup, channel=3, uid="4")
+
+XSensor100 = lazy(XSensor, multiply=0.01, round=2)
 
 Battery = spec(XSensor, param="battery")
-LED = spec(XToggle, param="sledOnline", uid="led", enabled=False)
-RSSI = spec(XSensor, param="rssi", enabled=False)
-PULSE = spec(XToggle, param="pulse", enabled=False)
-ZRSSI = spec(XSensor, param="subDevRssi", uid="rssi", enabled=False)
+LED = lazy(XToggle, param="sledOnline", uid="led", enabled=False)
+RSSI = lazy(XSensor, param="rssi", enabled=False)
+PULSE = lazy(XToggle, param="pulse", enabled=False)
+ZRSSI = lazy(XSensor, param="subDevRssi", uid="rssi", enabled=False)
 
 SPEC_SWITCH = [XSwitch, LED, RSSI, PULSE, XPulseWidth]
 SPEC_1CH = [Switch1, LED, RSSI]
@@ -155,41 +286,41 @@ SPEC_NSP = [
     XPanelBuzzer,
     XPanelScreen,
     XCPUTemperature,
-    spec(XButton, param="reboot", value=True),
+    lazy(XButton, param="reboot", value=True),
 ]
 
-Current1 = spec(XSensor100, param="current_00", uid="current_1")
-Current2 = spec(XSensor100, param="current_01", uid="current_2")
-Current3 = spec(XSensor100, param="current_02", uid="current_3")
-Current4 = spec(XSensor100, param="current_03", uid="current_4")
-Voltage1 = spec(XSensor100, param="voltage_00", uid="voltage_1")
-Voltage2 = spec(XSensor100, param="voltage_01", uid="voltage_2")
-Voltage3 = spec(XSensor100, param="voltage_02", uid="voltage_3")
-Voltage4 = spec(XSensor100, param="voltage_03", uid="voltage_4")
-Power1 = spec(XSensor100, param="actPow_00", uid="power_1")
-Power2 = spec(XSensor100, param="actPow_01", uid="power_2")
-Power3 = spec(XSensor100, param="actPow_02", uid="power_3")
-Power4 = spec(XSensor100, param="actPow_03", uid="power_4")
-
-EnergyDay = spec(XEnergyTotal, param="dayKwh", uid="energy_day", multiply=0.01, round=2)
-EnergyWeek = spec(
+Current1 = lazy(XSensor100, param="current_00", uid="current_1")
+Current2 = lazy(XSensor100, param="current_01", uid="current_2")
+Current3 = lazy(XSensor100, param="current_02", uid="current_3")
+Current4 = lazy(XSensor100, param="current_03", uid="current_4")
+Voltage1 = lazy(XSensor100, param="voltage_00", uid="voltage_1")
+Voltage2 = lazy(XSensor100, param="voltage_01", uid="voltage_2")
+Voltage3 = lazy(XSensor100, param="voltage_02", uid="voltage_3")
+Voltage4 = lazy(XSensor100, param="voltage_03", uid="voltage_4")
+Power1 = lazy(XSensor100, param="actPow_00", uid="power_1")
+Power2 = lazy(XSensor100, param="actPow_01", uid="power_2")
+Power3 = lazy(XSensor100, param="actPow_02", uid="power_3")
+Power4 = lazy(XSensor100, param="actPow_03", uid="power_4")
+
+EnergyDay = lazy(XEnergyTotal, param="dayKwh", uid="energy_day", multiply=0.01, round=2)
+EnergyWeek = lazy(
     XEnergyTotal, param="weekKwh", uid="energy_week", multiply=0.01, round=2
 )
-EnergyMonth = spec(
+EnergyMonth = lazy(
     XEnergyTotal, param="monthKwh", uid="energy_month", multiply=0.01, round=2
 )
-EnergyYear = spec(
+EnergyYear = lazy(
     XEnergyTotal, param="yearKwh", uid="energy_year", multiply=0.01, round=2
 )
 
 # backward compatibility for unique_id
-DoorLock = spec(XBinarySensor, param="lock", uid="", default_class="door")
+DoorLock = lazy(XBinarySensor, param="lock", uid="", default_class="door")
 
 TX_ULTIMATE = [
     XT5Light,
     XT5Action,
-    spec(XButton, param="soundAction", value=1, uid="alarm", enabled=False),
-    spec(XButton, param="soundAction", value=2, uid="bell", enabled=False),
+    lazy(XButton, param="soundAction", value=1, uid="alarm", enabled=False),
+    lazy(XButton, param="soundAction", value=2, uid="bell", enabled=False),
     XT5EffectLight,
     XT5EffectSound,
     XT5EffectStatus,
@@ -207,8 +338,8 @@ DEVICES = {
         XSwitch,
         LED,
         RSSI,
-        spec(XSensor, param="power"),
-        spec(
+        lazy(XSensor, param="power"),
+        lazy(
             XCloudEnergy,
             param="hundredDaysKwhData",
             uid="energy",
@@ -236,11 +367,11 @@ DEVICES = {
     ],
     17: [XFan17, LED, RSSI],
     18: [
-        spec(XSensor, param="temperature"),
-        spec(XSensor, param="humidity"),
-        spec(XSensor, param="dusty"),
-        spec(XSensor, param="light"),
-        spec(XSensor, param="noise"),
+        lazy(XSensor, param="temperature"),
+        lazy(XSensor, param="humidity"),
+        lazy(XSensor, param="dusty"),
+        lazy(XSensor, param="light"),
+        lazy(XSensor, param="noise"),
     ],
     # Sonoff B1 (only cloud)
     22: [XLightB1, RSSI],
@@ -249,7 +380,7 @@ DEVICES = {
         XDiffuserFan,
         XDiffuserLight,
         RSSI,
-        spec(XBinarySensor, param="water", uid=""),
+        lazy(XBinarySensor, param="water", uid=""),
     ],
     # Sonoff RF Brigde 433
     28: [XRemote, LED, RSSI],
@@ -261,10 +392,10 @@ DEVICES = {
         XSwitch,
         LED,
         RSSI,
-        spec(XSensor, param="current"),
-        spec(XSensor, param="power"),
-        spec(XSensor, param="voltage"),
-        spec(
+        lazy(XSensor, param="current"),
+        lazy(XSensor, param="power"),
+        lazy(XSensor, param="voltage"),
+        lazy(
             XCloudEnergy,
             param="hundredDaysKwhData",
             uid="energy",
@@ -290,7 +421,7 @@ DEVICES = {
     # Sonoff LED (only cloud)
     59: [XLightL1, RSSI],
     # ZigBee Bridge
-    66: [RSSI, LED, spec(XBinarySensor, param="zled", enabled=False)],
+    66: [RSSI, LED, lazy(XBinarySensor, param="zled", enabled=False)],
     # KingArt Garage Door Opener (KING-Q1)
     # https://github.com/AlexxIT/SonoffLAN/issues/1257
     67: [XCoverOP],
@@ -325,13 +456,13 @@ DEVICES = {
         Voltage2,
         Power1,
         Power2,
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_00",
             uid="energy_1",
             get_params={"getKwh_00": 2},
         ),
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_01",
             uid="energy_2",
@@ -364,25 +495,25 @@ DEVICES = {
         Power2,
         Power3,
         Power4,
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_00",
             uid="energy_1",
             get_params={"getKwh_00": 2},
         ),
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_01",
             uid="energy_2",
             get_params={"getKwh_01": 2},
         ),
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_02",
             uid="energy_3",
             get_params={"getKwh_02": 2},
         ),
-        spec(
+        lazy(
             XCloudEnergyDualR3,
             param="kwhHistories_03",
             uid="energy_4",
@@ -405,7 +536,7 @@ DEVICES = {
     # https://github.com/AlexxIT/SonoffLAN/issues/890
     # https://github.com/AlexxIT/SonoffLAN/pull/892
     # https://github.com/AlexxIT/SonoffLAN/pull/1035
-    136: [spec(XLightB05B, min_ct=0, max_ct=100), RSSI],
+    136: [lazy(XLightB05B, min_ct=0, max_ct=100), RSSI],
     137: [XLightL1, RSSI],
     # MINIR3, https://github.com/AlexxIT/SonoffLAN/issues/623#issuecomment-1365841454
     # MINIR4
@@ -415,17 +546,17 @@ DEVICES = {
         Startup1,
         LED,
         RSSI,
-        spec(XIntSwitch, param="relaySeparation", uid="detach", enabled=False),
-        spec(XButtonKey, uid="action"),
+        lazy(XIntSwitch, param="relaySeparation", uid="detach", enabled=False),
+        lazy(XButtonKey, uid="action"),
     ],
     # DW2-Wi-Fi-L, https://github.com/AlexxIT/SonoffLAN/issues/808
     154: [XWiFiDoor, Battery, RSSI],
     # Sonoff SwitchMan M5-1C, https://github.com/AlexxIT/SonoffLAN/issues/1432
-    160: [Switch1, LED, RSSI, spec(XButtonLocalKey, uid="action")],
+    160: [Switch1, LED, RSSI, lazy(XButtonLocalKey, uid="action")],
     # Sonoff SwitchMan M5-2C, https://github.com/AlexxIT/SonoffLAN/issues/1432
-    161: [Switch1, Switch2, LED, RSSI, spec(XButtonLocalKey, uid="action")],
+    161: [Switch1, Switch2, LED, RSSI, lazy(XButtonLocalKey, uid="action")],
     # Sonoff SwitchMan M5-3C, https://github.com/AlexxIT/SonoffLAN/issues/659
-    162: [Switch1, Switch2, Switch3, LED, RSSI, spec(XButtonLocalKey, uid="action")],
+    162: [Switch1, Switch2, Switch3, LED, RSSI, lazy(XButtonLocalKey, uid="action")],
     # DualR3 Lite, without power consumption
     165: [
         Switch1,
@@ -447,7 +578,7 @@ DEVICES = {
         XSwitchTH,
         XTemperatureTH,
         XHumidityTH,
-        spec(XIntSwitch, param="autoControlEnabled", uid="auto_mode", enabled=False),
+        lazy(XIntSwitch, param="autoControlEnabled", uid="auto_mode", enabled=False),
         LED,
         RSSI,
     ],
@@ -456,10 +587,10 @@ DEVICES = {
         Switch1,
         LED,
         RSSI,
-        spec(XSensor, param="current"),
-        spec(XSensor, param="power"),
-        spec(XSensor, param="voltage"),
-        spec(
+        lazy(XSensor, param="current"),
+        lazy(XSensor, param="power"),
+        lazy(XSensor, param="voltage"),
+        lazy(
             XCloudEnergy,
             param="hundredDaysKwhData",
             uid="energy",
@@ -473,28 +604,28 @@ DEVICES = {
         Startup1,
         LED,
         RSSI,
-        spec(XSensor100, param="current"),
-        spec(XSensor100, param="power"),
-        spec(XSensor100, param="voltage"),
+        lazy(XSensor100, param="current"),
+        lazy(XSensor100, param="power"),
+        lazy(XSensor100, param="voltage"),
         EnergyDay,
         EnergyMonth,
-        spec(
+        lazy(
             XCloudEnergyPOWR3,
             param="hoursKwhData",
             uid="energy",
             get_params={"getHoursKwh": {"start": 0, "end": 24 * 30 - 1}},
         ),
         # only for POWCT
-        spec(XSensor100, param="supplyCurrent", uid="current_supply"),
-        spec(XSensor100, param="supplyPower", uid="power_supply"),
-        spec(
+        lazy(XSensor100, param="supplyCurrent", uid="current_supply"),
+        lazy(XSensor100, param="supplyPower", uid="power_supply"),
+        lazy(
             XEnergyTotal,
             param="dayPowerSupply",
             uid="energy_day_supply",
             multiply=0.01,
             round=2,
         ),
-        spec(
+        lazy(
             XEnergyTotal,
             param="monthPowerSupply",
             uid="energy_month_supply",
@@ -534,30 +665,30 @@ DEVICES = {
     + TX_ULTIMATE,
     # CK-BL602-PCSW-01(225), https://github.com/AlexxIT/SonoffLAN/issues/1616
     225: [
-        spec(XBoolSwitch, param="switch"),
-        spec(XButton, param="restart", value=True, uid="restart"),
-        spec(XButton, param="forceShutdown", value=True, uid="shutdown"),
-        spec(XBoolSwitch, param="childLock", uid="child_lock", enabled=False),
+        lazy(XBoolSwitch, param="switch"),
+        lazy(XButton, param="restart", value=True, uid="restart"),
+        lazy(XButton, param="forceShutdown", value=True, uid="shutdown"),
+        lazy(XBoolSwitch, param="childLock", uid="child_lock", enabled=False),
         LED,
         RSSI,
         XStartup,
     ],
     # CK-BL602-W102SW18-01(226)
     226: [
-        spec(XBoolSwitch, param="switch"),
+        lazy(XBoolSwitch, param="switch"),
         LED,
         RSSI,
-        spec(XSensor, param="phase_0_c", uid="current"),
-        spec(XSensor, param="phase_0_p", uid="power"),
-        spec(XSensor, param="phase_0_v", uid="voltage"),
-        spec(XEnergyTotal, param="totalPower", uid="energy"),
+        lazy(XSensor, param="phase_0_c", uid="current"),
+        lazy(XSensor, param="phase_0_p", uid="power"),
+        lazy(XSensor, param="phase_0_v", uid="voltage"),
+        lazy(XEnergyTotal, param="totalPower", uid="energy"),
     ],
     # NSPanel Pro 120, https://github.com/AlexxIT/SonoffLAN/issues/1622
     228: SPEC_NSP,
     # CK-BK7238-W105SE10-01-HB(242) https://github.com/AlexxIT/SonoffLAN/issues/1673
     242: [
-        spec(XTempCorrection, multiply=0.01),
-        spec(XHumCorrection, multiply=0.01),
+        lazy(XTempCorrection, multiply=0.01),
+        lazy(XHumCorrection, multiply=0.01),
         Battery,
         ZRSSI,
     ],
@@ -573,9 +704,9 @@ DEVICES = {
         Switch4,
         LED,
         RSSI,
-        spec(XSensor100, param="power"),
-        spec(XSensor100, param="current"),
-        spec(XSensor100, param="voltage"),
+        lazy(XSensor100, param="power"),
+        lazy(XSensor100, param="current"),
+        lazy(XSensor100, param="voltage"),
     ],
     # SAWF-08P, https://github.com/AlexxIT/SonoffLAN/issues/1809
     # SAWF-07P, https://github.com/AlexxIT/SonoffLAN/issues/1816
@@ -583,9 +714,9 @@ DEVICES = {
         XTempCorrection,
         XHumCorrection,
         RSSI,
-        spec(XSensor, param="co2"),
-        spec(XSensor, param="pm10"),
-        spec(XSensor, param="pm2_5", uid="pm25"),
+        lazy(XSensor, param="co2"),
+        lazy(XSensor, param="pm10"),
+        lazy(XSensor, param="pm2_5", uid="pm25"),
     ],
     # BASIC-1GS, https://github.com/AlexxIT/SonoffLAN/issues/1672
     268: [Switch1, LED, RSSI],
@@ -597,14 +728,14 @@ DEVICES = {
         Startup2,
         LED,
         RSSI,
-        spec(XButtonLocalKey, uid="action"),
+        lazy(XButtonLocalKey, uid="action"),
     ],
     # Sonoff S61STPF:
     276: [
         Switch1,
-        spec(XSensor100, param="power"),
-        spec(XSensor100, param="current"),
-        spec(XSensor100, param="voltage"),
+        lazy(XSensor100, param="power"),
+        lazy(XSensor100, param="current"),
+        lazy(XSensor100, param="voltage"),
         EnergyDay,
         EnergyWeek,
         EnergyMonth,
@@ -614,9 +745,9 @@ DEVICES = {
     ],
     277: [
         XMiniDim,
-        spec(XSensor100, param="power"),
-        spec(XSensor100, param="current"),
-        spec(XSensor100, param="voltage"),
+        lazy(XSensor100, param="power"),
+        lazy(XSensor100, param="current"),
+        lazy(XSensor100, param="voltage"),
         LED,
         RSSI,
     ],
@@ -629,17 +760,17 @@ DEVICES = {
     # https://github.com/AlexxIT/SonoffLAN/issues/1557
     1258: [XZigbeeColorTemp],
     # https://github.com/AlexxIT/SonoffLAN/issues/972
-    1514: [XZigbeeCover, spec(XSensor, param="battery", multiply=2)],
+    1514: [XZigbeeCover, lazy(XSensor, param="battery", multiply=2)],
     # ZCL_HA_DEVICEID_TEMPERATURE_SENSOR
     1770: [
-        spec(XSensor100, param="temperature"),
-        spec(XSensor100, param="humidity"),
+        lazy(XSensor100, param="temperature"),
+        lazy(XSensor100, param="humidity"),
         Battery,
     ],
     # https://github.com/AlexxIT/SonoffLAN/issues/1150
     1771: [
-        spec(XSensor100, param="temperature"),
-        spec(XSensor100, param="humidity"),
+        lazy(XSensor100, param="temperature"),
+        lazy(XSensor100, param="humidity"),
         Battery,
     ],
     # ZIGBEE_MOBILE_SENSOR
@@ -650,14 +781,14 @@ DEVICES = {
     3258: [XZigbeeLight],
     # https://github.com/AlexxIT/SonoffLAN/issues/852
     4026: [
-        spec(XBinarySensor, param="water", uid="", default_class="moisture"),
+        lazy(XBinarySensor, param="water", uid="", default_class="moisture"),
         Battery,
     ],
     4256: [
-        spec(XZigbeeSwitches, channel=0, uid="1"),
-        spec(XZigbeeSwitches, channel=1, uid="2"),
-        spec(XZigbeeSwitches, channel=2, uid="3"),
-        spec(XZigbeeSwitches, channel=3, uid="4"),
+        lazy(XZigbeeSwitches, channel=0, uid="1"),
+        lazy(XZigbeeSwitches, channel=1, uid="2"),
+        lazy(XZigbeeSwitches, channel=2, uid="3"),
+        lazy(XZigbeeSwitches, channel=3, uid="4"),
     ],
     7000: [XButtonKey, Battery],
     # SNZB-03P, https://github.com/AlexxIT/SonoffLAN/issues/1435
@@ -674,48 +805,48 @@ DEVICES = {
     7010: [XSwitch, ZRSSI],
     # https://github.com/AlexxIT/SonoffLAN/issues/1166
     7014: [
-        spec(XSensor100, param="temperature"),
-        spec(XSensor100, param="humidity"),
+        lazy(XSensor100, param="temperature"),
+        lazy(XSensor100, param="humidity"),
         Battery,
     ],
     # SNZB-06P
     7016: [XHumanSensor, XLightSensor, XSensitivity, ZRSSI],
     7017: [
         XThermostatTRVZB,
-        spec(XSensor, param="workMode", uid="work_mode"),
-        spec(XSensor, param="workState", uid="work_state"),
-        spec(XSensor, param="temperature", multiply=0.1),
-        spec(
+        lazy(XSensor, param="workMode", uid="work_mode"),
+        lazy(XSensor, param="workState", uid="work_state"),
+        lazy(XSensor, param="temperature", multiply=0.1),
+        lazy(
             XSensor,
             param="manTargetTemp",
             multiply=0.1,
             uid="manual_target_temperature",
         ),
-        spec(
+        lazy(
             XSensor,
             param="autoTargetTemp",
             multiply=0.1,
             uid="auto_target_temperature",
         ),
-        spec(
+        lazy(
             XSensor,
             param="curTargetTemp",
             multiply=0.1,
             uid="current_target_temperature",
         ),
-        spec(
+        lazy(
             XSensor,
             param="ecoTargetTemp",
             multiply=0.1,
             uid="eco_target_temperature",
         ),
         # FW 1.4.0+: valve opening percentage
-        spec(XSensor, param="openPercent", uid="valve_opening"),
+        lazy(XSensor, param="openPercent", uid="valve_opening"),
         XTempCorrectionNumber,
-        spec(XBoolSwitch, param="childLock", uid="child_lock"),
-        spec(XBoolSwitch, param="windowSwitch", uid="window_switch"),
-        spec(XHexVoltageTRVZB, param="runVoltage", uid="run_voltage"),
-        spec(XHexVoltageTRVZB, param="limitVoltage", uid="limit_voltage"),
+        lazy(XBoolSwitch, param="childLock", uid="child_lock"),
+        lazy(XBoolSwitch, param="windowSwitch", uid="window_switch"),
+        lazy(XHexVoltageTRVZB, param="runVoltage", uid="run_voltage"),
+        lazy(XHexVoltageTRVZB, param="limitVoltage", uid="limit_voltage"),
         Battery,
         ZRSSI,
     ],
@@ -723,19 +854,19 @@ DEVICES = {
     7019: [XWaterSensor, Battery],
     # SWV, https://github.com/AlexxIT/SonoffLAN/issues/1497
     7027: [
-        spec(XBoolSwitch, param="switch"),
+        lazy(XBoolSwitch, param="switch"),
         Battery,
         XTodayWaterUsage,
         ZRSSI,
     ],
     # MINI-ZB2GS-L https://github.com/AlexxIT/SonoffLAN/issues/1701
-    7029: [Switch1, Switch2, spec(XButtonLocalKey, uid="action")],
+    7029: [Switch1, Switch2, lazy(XButtonLocalKey, uid="action")],
     # S60ZBTPF, https://github.com/AlexxIT/SonoffLAN/issues/1615
     7032: [
         Switch1,
-        spec(XSensor100, param="power"),
-        spec(XSensor100, param="current"),
-        spec(XSensor100, param="voltage"),
+        lazy(XSensor100, param="power"),
+        lazy(XSensor100, param="current"),
+        lazy(XSensor100, param="voltage"),
         EnergyDay,
         EnergyMonth,
     ],
@@ -745,43 +876,51 @@ DEVICES = {
     7034: [XZBCover, LED, RSSI],
     # SNZB-02DR2
     7038: [
-        spec(XTempCorrection, multiply=0.01),
-        spec(XHumCorrection, multiply=0.01),
+        lazy(XTempCorrection, multiply=0.01),
+        lazy(XHumCorrection, multiply=0.01),
         Battery,
         ZRSSI,
-        spec(
+        lazy(
             XSensor, param="remoteTemperature", uid="remote_temperature", multiply=0.01
         ),
     ],
     # SNZB-01M, https://github.com/AlexxIT/SonoffLAN/issues/1786
     7039: [XButtonKey, Battery, ZRSSI],
     # SWV-ZNE, https://github.com/AlexxIT/SonoffLAN/issues/1814
-    7047: [spec(XBoolSwitch, param="switch_00", uid="switch"), Battery, ZRSSI],
+    7047: [lazy(XBoolSwitch, param="switch_00", uid="switch"), Battery, ZRSSI],
     # SNZB-03PR2 https://github.com/AlexxIT/SonoffLAN/issues/1824
-    7055: [XHumanSensor, spec(XSensor, param="illumination"), Battery, ZRSSI],
+    7055: [XHumanSensor, lazy(XSensor, param="illumination"), Battery, ZRSSI],
 }
 
 
+def get_base_spec(device: dict) -> list:
+    """Return spec for device UIID, classes can be not resolved yet."""
+    uiid = device["extra"]["uiid"]
+    if uiid in DEVICES:
+        return DEVICES[uiid]
+    if "switch" in device["params"]:
+        return SPEC_SWITCH
+    if "switches" in device["params"]:
+        return SPEC_4CH
+    return [XUnknown]
+
+
 def get_spec(device: dict) -> list:
     uiid = device["extra"]["uiid"]
 
+    classes = resolve_spec(get_base_spec(device))
     if uiid in DEVICES:
-        classes = DEVICES[uiid]
-    elif "switch" in device["params"]:
-        classes = SPEC_SWITCH
-    elif "switches" in device["params"]:
-        classes = SPEC_4CH
-    else:
-        classes = [XUnknown]
+        DEVICES[uiid] = classes
 
     # DualR3 in cover mode
     if uiid in [126, 165] and device["params"].get("workMode") == 2:
         classes = [cls for cls in classes if XSwitches not in cls.__bases__]
-        classes = [XCoverDualR3, XFanDualR3] + classes
+        classes = resolve_spec([XCoverDualR3, XFanDualR3]) + classes
 
     # NSPanel Climate disable without switch configuration
     if uiid == 133 and not device["params"].get("HMI_ATCDevice"):
-        classes = [cls for cls in classes if XClimateNS not in cls.__bases__]
+        climate = XClimateNS.resolve()
+        classes = [cls for cls in classes if climate not in cls.__bases__]
 
     # SNZB-06P has no battery
     if uiid == 2026 and not device["params"].get("battery"):
@@ -861,9 +1000,30 @@ def get_spec_wrapper(func, sensors: list):
     return wrapped
 
 
+def get_platforms(device: dict) -> set[str]:
+    """Return Hass platforms for device entities without loading them."""
+    uiid = device["extra"]["uiid"]
+    platforms = {get_platform(cls) for cls in get_base_spec(device)}
+
+    # DualR3 in cover mode
+    if uiid in [126, 165]:
+        platforms |= {"cover", "fan"}
+
+    if device_class := device.get("device_class"):
+        if not isinstance(device_class, list):
+            device_class = [device_class]
+        for item in device_class:
+            platforms.add(next(iter(item)) if isinstance(item, dict) else item)
+
+    return platforms
+
+
 def set_default_class(device_class: str):
     if device_class != "light":
         return
+
+    from homeassistant.components.light import ColorMode, LightEntity
+
     for cls in (XSwitch, XSwitches):
         cls.__bases__ = (XEntity, LightEntity)
         cls._attr_color_mode = ColorMode.ONOFF
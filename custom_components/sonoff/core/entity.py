@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from homeassistant.helpers.device_registry import CONNECTION_NETWORK_MAC
@@ -38,12 +39,54 @@ NAMES = {
 }
 
 
+class XStateWriter:
+    """Coalesce HA state writes. Each changed entity is written once per loop
+    iteration (delay=0) or once per delay window.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.dirty: dict[Entity, None] = {}
+        self.handle: asyncio.Handle | None = None
+        self.writes = 0
+        self.suppressed = 0
+
+    def write(self, entity: Entity):
+        if entity in self.dirty:
+            self.suppressed += 1
+            return
+
+        self.dirty[entity] = None
+
+        if self.handle is None:
+            if self.delay:
+                self.handle = entity.hass.loop.call_later(self.delay, self.flush)
+            else:
+                self.handle = entity.hass.loop.call_soon(self.flush)
+
+    def flush(self):
+        self.handle = None
+        dirty, self.dirty = self.dirty, {}
+        for entity in dirty:
+            try:
+                entity._async_write_ha_state()
+                self.writes += 1
+            except Exception as e:
+                _LOGGER.warning(f"{entity.entity_id} !! can't write state", exc_info=e)
+
+    def diagnostics(self) -> dict:
+        return {"writes": self.writes, "suppressed": self.suppressed}
+
+
 class XEntity(Entity):
     event: bool = False  # if True - skip set_state on entity init
-    params: set = {}
+    params: set = frozenset()
     param: str = None
     uid: str = None
 
+    # optional global writer for coalesced state writes
+    writer: XStateWriter = None
+
     _attr_should_poll = False
 
     def __init__(self, ewelink: XRegistry, device: XDevice) -> None:
@@ -97,11 +140,25 @@ class XEntity(Entity):
         except Exception as e:
             _LOGGER.error(f"Can't init device: {device}", exc_info=e)
 
-        ewelink.dispatcher_connect(deviceid, self.internal_update)
+        # default internal_update can skip updates without entity params,
+        # so subscribe only to them (updates without params come to all)
+        if type(self).internal_update is XEntity.internal_update:
+            disconnect = ewelink.dispatcher_connect(
+                deviceid, self.internal_update, self.params
+            )
+        else:
+            disconnect = ewelink.dispatcher_connect(deviceid, self.internal_update)
+        # entity can be removed without registry reload (device removed from
+        # cloud), so don't leave it subscribed
+        self.async_on_remove(disconnect)
 
         if parent := device.get("parent"):
             self._attr_device_info["via_device"] = (DOMAIN, parent["deviceid"])
-            ewelink.dispatcher_connect(parent["deviceid"], self.internal_parent_update)
+            # parent updates can change only availability of child
+            disconnect = ewelink.dispatcher_connect(
+                parent["deviceid"], self.internal_parent_update, set()
+            )
+            self.async_on_remove(disconnect)
 
     @property
     def suggested_object_id(self) -> str | None:
@@ -116,8 +173,7 @@ class XEntity(Entity):
         pass
 
     def internal_available(self) -> bool:
-        ok = self.ewelink.can_cloud(self.device) or self.ewelink.can_local(self.device)
-        return ok
+        return self.ewelink.available(self.device)
 
     def internal_update(self, params: dict = None):
         available = self.internal_available()
@@ -127,11 +183,18 @@ class XEntity(Entity):
             self._attr_available = available
             change = True
 
-        if params and params.keys() & self.params:
+        if params and not self.params.isdisjoint(params):
             self.set_state(params)
             change = True
 
         if change and self.hass:
+            self.write_state()
+
+    def write_state(self):
+        # event entities are never delayed
+        if self.writer and not self.event:
+            self.writer.write(self)
+        else:
             self._async_write_ha_state()
 
     def internal_parent_update(self, params: dict = None):
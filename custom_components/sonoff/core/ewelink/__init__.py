@@ -1,27 +1,107 @@
 import asyncio
+import heapq
 import logging
+import random
 import time
 
 from aiohttp import ClientSession
 
-from .base import SIGNAL_CONNECTED, SIGNAL_UPDATE, XDevice, XRegistryBase
+from .base import SIGNAL_CONNECTED, SIGNAL_UPDATE, XDevice, XHistogram, XRegistryBase
 from .cloud import XRegistryCloud
 from .local import XRegistryLocal
 
 _LOGGER = logging.getLogger(__name__)
 
 SIGNAL_ADD_ENTITIES = "add_entities"
+SIGNAL_HOSTS = "hosts"
 LOCAL_TTL = 60
+# max number of simultaneous background local requests
+LOCAL_CONCURRENCY = 10
+SCHEDULE_INTERVAL = 5
+SCHEDULE_JITTER = 1.0
+# same params from LAN and Cloud within this time are the same update
+DUPLICATE_WINDOW = 2
+# params of momentary events (buttons, RF), same params can be a new event
+EVENT_PARAMS = {"key", "localKeyPass", "triggerType", "slide"}
+# delay before parallel Cloud command in hedged mode
+HEDGE_DELAY = 0.5
+HEDGE_DELAY_MIN = 0.1
+
+
+class XRoute:
+    """LAN and Cloud stats for one device. Helps to select the fastest healthy
+    transport and LAN timeout based on real device response time.
+    """
+
+    healthy = 0.7  # min success rate
+    min_samples = 10
+
+    def __init__(self):
+        self.local = XHistogram()
+        self.cloud = XHistogram()
+
+    async def send(self, transport: str, coro, cancelled: set = None) -> str:
+        """Await transport request and add its result to stats.
+
+        :param cancelled: optional, transports with cancelled requests, such
+          request isn't a transport fail
+        """
+        # LAN time includes waiting in XLocalQueue, same as for LAN timeout
+        ts = time.time()
+        ok = await coro
+        if not cancelled or transport not in cancelled:
+            getattr(self, transport).add(ok == "online", time.time() - ts)
+        return ok
+
+    def local_first(self) -> bool:
+        if self.local.ok < self.healthy:
+            return self.cloud.ok < self.healthy
+        if self.cloud.ok < self.healthy or self.cloud.total < self.min_samples:
+            return True
+        return self.local.rtt is None or self.local.rtt <= self.cloud.rtt
+
+    def local_timeout(self) -> float:
+        if self.local.total < self.min_samples:
+            return 1
+        return min(max(2 * self.local.percentile(0.95), 0.5), 5)
+
+    def diagnostics(self) -> dict:
+        return {
+            "local": self.local.diagnostics(),
+            "cloud": self.cloud.diagnostics(),
+            "local_first": self.local_first(),
+            "local_timeout": self.local_timeout(),
+        }
 
 
 class XRegistry(XRegistryBase):
     config: dict = None
+    hedged: bool = False  # send command with LAN and Cloud in parallel
     task: asyncio.Task | None = None
 
     def __init__(self, session: ClientSession):
         super().__init__(session)
 
         self.devices: dict[str, XDevice] = {}
+        # topology: parent deviceid => {child deviceid: child device}
+        self.children: dict[str, dict[str, XDevice]] = {}
+        # topology: child deviceid => parent deviceid
+        self.parents: dict[str, str] = {}
+        self.routes: dict[str, XRoute] = {}  # LAN and Cloud stats for devices
+
+        # last update for each device and transport:
+        # (sequence, time, params, already matched with another transport)
+        self.last_updates: dict[str, dict[str, tuple]] = {}
+        self.duplicates = 0
+
+        # local updates scheduler: heap with (deadline, deviceid)
+        self.schedule_heap: list[tuple[float, str]] = []
+        self.schedule_due: dict[str, float] = {}
+        self.semaphore = asyncio.Semaphore(LOCAL_CONCURRENCY)
+        self.wakeup = asyncio.Event()
+
+        # deviceid => (cloud, local), only while processing one dispatcher signal
+        self.available_cache: dict[str, tuple[bool, bool]] | None = None
 
         self.cloud = XRegistryCloud(session)
         self.cloud.dispatcher_connect(SIGNAL_CONNECTED, self.cloud_connected)
@@ -36,8 +116,12 @@ class XRegistry(XRegistryBase):
 
         entities = []
 
+        # raw dicts from cloud, cache or LAN => XDevice with slots for hot state
+        devices = [d if isinstance(d, XDevice) else XDevice(d) for d in devices]
+
         # Devices without parent will be first, so via_device option won't fail
         devices = sorted(devices, key=lambda d: d.get("params", {}).get("parentid", ""))
+        index = {d["deviceid"]: d for d in devices}
 
         for device in devices:
             did = device["deviceid"]
@@ -51,12 +135,10 @@ class XRegistry(XRegistryBase):
                 _LOGGER.debug(f"{did} UIID {uiid:04} | %s", device["params"])
 
                 if parentid := device["params"].get("parentid"):
-                    try:
-                        device["parent"] = next(
-                            d for d in devices if d["deviceid"] == parentid
-                        )
-                    except StopIteration:
-                        pass
+                    # parent can be from this batch or from already known devices
+                    parent = index.get(parentid) or self.devices.get(parentid)
+                    if parent:
+                        device["parent"] = parent
 
                 # at this moment entities can catch signals with device_id and
                 # update their states, but they can be added to hass later
@@ -64,18 +146,139 @@ class XRegistry(XRegistryBase):
 
                 self.devices[did] = device
 
+                if parent := device.get("parent"):
+                    self.children.setdefault(parentid, {})[did] = device
+                    self.parents[did] = parentid
+                    # child can be added after SPM-Main was found in LAN
+                    if parent.local and parent.get("localtype") == "meter":
+                        self.schedule(device, time.time() + SCHEDULE_INTERVAL)
+
             except Exception as e:
                 _LOGGER.warning(f"{did} !! can't setup device", exc_info=e)
 
         return entities
 
+    def sync_devices(self, devices: list[XDevice], use_params: bool = True) -> list:
+        """Update known devices with new data (from cloud) and setup new ones.
+        Return entities for new devices.
+
+        :param use_params: optional, use cloud params for known devices, they
+          are used only for cloud online devices without LAN connection,
+          otherwise cloud state can be older than current one
+        """
+        new_devices = []
+
+        for device in devices:
+            did = device["deviceid"]
+            known = self.devices.get(did)
+            if not known or "params" not in known:
+                new_devices.append(device)
+                continue
+
+            params = device.pop("params", {})
+            known.update(device)
+
+            try:
+                known.update(self.config["devices"][did])
+            except Exception:
+                pass
+
+            if use_params and known.get("online") and not known.local and params:
+                known["params"].update(params)
+                self.dispatcher_send(did, params)
+
+            self.dispatcher_send(did)  # update available flag for all entities
+
+        return self.setup_devices(new_devices) if new_devices else []
+
+    def remove_device(self, did: str) -> bool:
+        """Remove device from registry with its signals and children links."""
+        if not (device := self.devices.pop(did, None)):
+            return False
+
+        for childid in self.children.pop(did, {}):
+            self.parents.pop(childid, None)
+        if parentid := self.parents.pop(did, None):
+            self.children.get(parentid, {}).pop(did, None)
+
+        self.schedule_due.pop(did, None)  # heap item will be skipped
+        self.last_updates.pop(did, None)
+        self.dispatcher.pop(did, None)
+        self.dispatcher_index.pop(did, None)
+        return True
+
+    def local_hosts(self) -> dict[str, dict]:
+        """Return known LAN hosts of devices for cache."""
+        return {
+            did: {"host": device["host"], "localtype": device.get("localtype")}
+            for did, device in self.devices.items()
+            if device.get("host") and "params" in device
+        }
+
+    async def probe_hosts(self, hosts: dict[str, dict]):
+        """Check cached LAN hosts of devices without waiting zeroconf. Number of
+        simultaneous requests is limited by send_local.
+        """
+        devices = []
+        for did, item in hosts.items():
+            device = self.devices.get(did)
+            # skip unknown devices and devices with host from config or zeroconf
+            if not device or "params" not in device or device.get("host"):
+                continue
+
+            device["host"] = item["host"]
+            device["localtype"] = item.get("localtype")
+            device.local = False
+            device.localfail = 0
+            device.localping = device.localrecv = 0
+            devices.append(device)
+
+        if not devices:
+            return
+
+        _LOGGER.debug(f"Probe {len(devices)} cached hosts")
+        await asyncio.gather(*[self.send_local(device) for device in devices])
+
+        # failed devices will be pinged again by scheduler
+        for device in devices:
+            self.schedule(device, time.time())
+
+    async def discover(self, hosts: list[str]) -> int:
+        """Active LAN discovery for hosts without online local devices."""
+        skip = set()
+        for device in self.devices.values():
+            if device.local and (host := device.get("host")):
+                skip.add(host)
+                skip.add(host.removesuffix(":8081"))
+
+        hosts = [host for host in hosts if host not in skip]
+        if not hosts:
+            return 0
+
+        _LOGGER.debug(f"Discovery for {len(hosts)} hosts")
+        return await self.local.discover(hosts)
+
     @property
     def online(self) -> bool:
         return self.cloud.online is not None or self.local.online
 
+    def diagnostics(self) -> dict:
+        return {
+            "cloud": self.cloud.diagnostics(),
+            "local": self.local.diagnostics(),
+            "routes": {k: v.diagnostics() for k, v in self.routes.items()},
+            "duplicates": self.duplicates,
+        }
+
     async def stop(self, *args):
         self.devices.clear()
+        self.children.clear()
+        self.parents.clear()
+        self.last_updates.clear()
         self.dispatcher.clear()
+        self.dispatcher_index.clear()
+        self.schedule_heap.clear()
+        self.schedule_due.clear()
 
         await self.cloud.stop()
         await self.local.stop()
@@ -91,7 +294,7 @@ class XRegistry(XRegistryBase):
         params_lan: dict = None,
         cmd_lan: str = None,
         query_cloud: bool = True,
-        timeout_lan: int = 1,
+        timeout_lan: float = None,
     ) -> None:
         """Send command to device with LAN and Cloud. Usual params are same.
 
@@ -103,7 +306,8 @@ class XRegistry(XRegistryBase):
         :param cmd_lan: optional if LAN command different
         :param query_cloud: optional query Cloud state after update state,
           ignored if params empty
-        :param timeout_lan: optional custom LAN timeout
+        :param timeout_lan: optional custom LAN timeout, by default depends on
+          device response time
         """
         seq = await self.sequence()
 
@@ -119,34 +323,141 @@ class XRegistry(XRegistryBase):
         can_local = self.can_local(device)
         can_cloud = self.can_cloud(device)
 
-        if can_local and can_cloud:
-            # try to send a command locally (wait no more than a second)
-            ok = await self.local.send(
-                main_device, params_lan or params, cmd_lan, seq, timeout_lan
+        route = self.route(device)
+        if timeout_lan is None:
+            timeout_lan = route.local_timeout()
+
+        if can_local and can_cloud and self.hedged:
+            ok = await self.send_hedged(
+                route,
+                device,
+                main_device,
+                params,
+                params_lan or params,
+                cmd_lan,
+                seq,
+                timeout_lan,
+            )
+            if ok is None:
+                self.ping_now(main_device)
+            elif ok == "cloud" and query_cloud and params:
+                # force update device actual status
+                await self.cloud.send(device, timeout=0)
+
+        elif can_local and can_cloud and route.local_first():
+            # try to send a command locally (wait no more than LAN timeout)
+            ok = await route.send(
+                "local",
+                self.local.send(
+                    main_device, params_lan or params, cmd_lan, seq, timeout_lan
+                ),
             )
 
             # otherwise send a command through the cloud
             if ok != "online":
-                ok = await self.cloud.send(device, params, seq)
+                ok = await route.send("cloud", self.cloud.send(device, params, seq))
                 if ok != "online":
-                    main_device["localping"] = 0  # instant local ping request
+                    self.ping_now(main_device)
                 elif query_cloud and params:
                     # force update device actual status
                     await self.cloud.send(device, timeout=0)
 
+        elif can_local and can_cloud:
+            # LAN is unstable or much slower, so try to send a command with cloud
+            ok = await route.send("cloud", self.cloud.send(device, params, seq))
+            if ok == "online":
+                if query_cloud and params:
+                    await self.cloud.send(device, timeout=0)
+            else:
+                ok = await route.send(
+                    "local",
+                    self.local.send(
+                        main_device, params_lan or params, cmd_lan, seq, timeout_lan
+                    ),
+                )
+                if ok != "online":
+                    self.ping_now(main_device)
+
         elif can_local:
-            ok = await self.local.send(main_device, params_lan or params, cmd_lan, seq)
+            ok = await route.send(
+                "local",
+                self.local.send(main_device, params_lan or params, cmd_lan, seq),
+            )
             if ok != "online":
-                main_device["localping"] = 0  # instant local ping request
+                self.ping_now(main_device)
 
         elif can_cloud:
-            ok = await self.cloud.send(device, params, seq)
+            ok = await route.send("cloud", self.cloud.send(device, params, seq))
             if ok == "online" and query_cloud and params:
                 await self.cloud.send(device, timeout=0)
 
         else:
             return
 
+    def route(self, device: XDevice) -> "XRoute":
+        did = device["deviceid"]
+        route = self.routes.get(did)
+        if route is None:
+            route = self.routes[did] = XRoute()
+        return route
+
+    async def send_hedged(
+        self,
+        route: "XRoute",
+        device: XDevice,
+        main_device: XDevice,
+        params: dict,
+        params_lan: dict,
+        cmd_lan: str,
+        sequence: str,
+        timeout_lan: float = 5,
+    ) -> str | None:
+        """Send command with LAN. If LAN doesn't respond in usual device time -
+        send same command with Cloud in parallel. Both commands have same
+        sequence, so the device will process it only once.
+
+        Return transport name ("local" or "cloud") of first successful response.
+        """
+        delay = HEDGE_DELAY
+        if rtt := route.local.rtt:
+            delay = min(max(3 * rtt, HEDGE_DELAY_MIN), HEDGE_DELAY)
+
+        cancelled = set()
+        local = asyncio.create_task(
+            route.send(
+                "local",
+                self.local.send(
+                    main_device, params_lan, cmd_lan, sequence, timeout_lan
+                ),
+                cancelled,
+            )
+        )
+        done, _ = await asyncio.wait((local,), timeout=delay)
+        if done and local.result() == "online":
+            return "local"
+
+        did = device["deviceid"]
+        _LOGGER.debug(f"{did} !! Hedged send with Cloud after {delay:.2f}s")
+
+        cloud = asyncio.create_task(
+            route.send("cloud", self.cloud.send(device, params, sequence), cancelled)
+        )
+        tasks = {local: "local", cloud: "cloud"}
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if not task.cancelled() and task.result() == "online":
+                    # the device already has the command, no need in second one
+                    for task2 in pending:
+                        cancelled.add(tasks[task2])
+                        task2.cancel()
+                    return tasks[task]
+
+        return None
+
     async def send_bulk(self, device: XDevice, params: dict):
         assert "switches" in params
 
@@ -191,13 +502,13 @@ class XRegistry(XRegistryBase):
             return await self.send(device, params)
 
     async def send_cloud(
-        self, device: XDevice, params: dict = None, query=True
+        self, device: XDevice, params: dict = None, query=True, background=False
     ) -> str | None:
         if not self.can_cloud(device):
             return None
-        ok = await self.cloud.send(device, params)
+        ok = await self.cloud.send(device, params, background=background)
         if ok == "online" and query and params:
-            await self.cloud.send(device, timeout=0)
+            await self.cloud.send(device, timeout=0, background=background)
         return ok
 
     def cloud_connected(self):
@@ -219,15 +530,17 @@ class XRegistry(XRegistryBase):
             return
 
         params = msg["params"]
-        device["cloud_seq"] = seq = msg.get("sequence")
+        device.cloud_seq = seq = msg.get("sequence")
 
         _LOGGER.debug(f"{did} <= Cloud3 | %s | {seq}", params)
 
+        online = device["online"]
+
         # process online change
         if "online" in params:
             device["online"] = params["online"]
             # check if LAN online after cloud status change
-            device["localping"] = 0  # instant local ping request
+            self.ping_now(device)
 
         # Fix bug - cloud sends `{"subDevRssi": 127}` even for offline devices
         elif device["online"] is False and params.keys() != {"subDevRssi"}:
@@ -236,7 +549,12 @@ class XRegistry(XRegistryBase):
         if "sledOnline" in params:
             device["params"]["sledOnline"] = params["sledOnline"]
 
-        self.dispatcher_send(did, params)
+        if not self.is_duplicate(did, "cloud", seq, params):
+            self.dispatcher_send(did, params)
+
+        # update available flag for all entities, not only with these params
+        if device["online"] != online:
+            self.dispatcher_send(did)
 
     def local_update(self, msg: dict):
         mainid: str = msg["deviceid"]
@@ -244,6 +562,11 @@ class XRegistry(XRegistryBase):
         params: dict = msg.get("params")
         # check device in known devices list
         if not device:
+            # active discovery doesn't know device type, zeroconf will setup it
+            if not msg.get("localtype"):
+                _LOGGER.debug(f"{mainid} !! skip setup for device without type")
+                return
+
             # check payload already decrypted (DIY devices)
             if not params:
                 try:
@@ -254,15 +577,17 @@ class XRegistry(XRegistryBase):
                 except Exception:
                     _LOGGER.debug(f"{mainid} !! skip setup for encrypted device")
                     # save device to known list, so no more decrypt tries
-                    self.devices[mainid] = msg
+                    self.devices[mainid] = XDevice(msg)
                     return
 
             from ..devices import setup_diy
 
             # setup new device as DIY device
-            device = setup_diy(msg)
-            entities = self.setup_devices([device])
+            entities = self.setup_devices([setup_diy(msg)])
             self.dispatcher_send(SIGNAL_ADD_ENTITIES, entities)
+            device = self.devices.get(mainid)
+            if not device:
+                return
 
         elif not params:
             if "devicekey" not in device:
@@ -284,7 +609,7 @@ class XRegistry(XRegistryBase):
         realid = msg.get("subdevid", mainid)
         tag = "Local3" if "host" in msg else "Local0"
         host = msg.get("host", "^^^")
-        device["local_seq"] = seq = msg.get("seq")
+        device.local_seq = seq = msg.get("seq")
 
         _LOGGER.debug(f"{realid} <= {tag} | {host} | %s | {seq}", params)
 
@@ -297,60 +622,173 @@ class XRegistry(XRegistryBase):
         if "host" in msg and device.get("host") != msg["host"]:
             # params for custom sensor
             device["host"] = params["host"] = msg["host"]
-            device["localtype"] = msg["localtype"]
+            # discovery doesn't know localtype of device
+            if msg.get("localtype"):
+                device["localtype"] = msg["localtype"]
+            self.dispatcher_send(SIGNAL_HOSTS)
+
+        online = device.local
 
         ts = time.time()
-        device["local"] = True
-        device["localfail"] = 0
-        device["localping"] = ts + 59  # one second less than a minute
-        device["localrecv"] = ts
+        device.local = True
+        device.localfail = 0
+        device.localping = ts + 59  # one second less than a minute
+        device.localrecv = ts
+
+        if mainid not in self.schedule_due:
+            self.schedule(device, ts + 4)
+
+        if not online:
+            self.schedule_children(device)
 
-        self.dispatcher_send(realid, params)
+        if not self.is_duplicate(realid, "local", seq, params):
+            self.dispatcher_send(realid, params)
 
         # send empty msg to main device for updating available flag
-        if realid != mainid:
+        if realid != mainid or not online:
             self.dispatcher_send(mainid, None)
 
+    def is_duplicate(self, did: str, transport: str, seq, params: dict) -> bool:
+        """Check if same update already was processed. It can be a mDNS repeat
+        of LAN message with the same sequence, or same params from another
+        transport (duplex mode).
+        """
+        if not params:
+            return False
+
+        ts = time.time()
+        updates = self.last_updates.setdefault(did, {})
+
+        if self.is_repeat(updates, transport, seq, params, ts):
+            _LOGGER.debug(f"{did} !! skip duplicate update")
+            self.duplicates += 1
+            return True
+
+        updates[transport] = (seq, ts, params, False)
+        return False
+
+    @staticmethod
+    def is_repeat(updates: dict, transport: str, seq, params: dict, ts: float) -> bool:
+        # mDNS repeat of LAN message with the same sequence
+        last = updates.get(transport)
+        if last and seq is not None and last[0] == seq and last[2] == params:
+            return True
+
+        # events are never merged between transports, app command and physical
+        # press can have the same params
+        if not EVENT_PARAMS.isdisjoint(params) or any(
+            k.startswith("rfTrig") for k in params
+        ):
+            return False
+
+        # each update can have only one copy from another transport
+        for other, last in updates.items():
+            if (
+                other != transport
+                and not last[3]
+                and last[2] == params
+                and ts - last[1] <= DUPLICATE_WINDOW
+            ):
+                updates[other] = (*last[:3], True)
+                return True
+
+        return False
+
     async def run_forever(self):
+        """Run scheduled local updates. Only devices with the deadline are
+        processed, so it doesn't depend on the total number of devices.
+        """
         while True:
-            ts = time.time()
-            for device in self.devices.values():
-                try:
-                    if "local" in device:
-                        self.update_local(device, ts)
-                    elif parent := device.get("parent"):
-                        # Support childrens only for SPM-Main (128)
-                        if parent.get("localtype") == "meter":
-                            self.update_local_child(parent, device)
-                except Exception as e:
-                    _LOGGER.warning("run_forever", exc_info=e)
-            await asyncio.sleep(5)
-
-    def update_local(self, device: XDevice, ts: float):
-        # 1. Update sensors data for Power and TH devices if we haven't received them
-        #    for more than 5 seconds.
-        if (
-            ts >= device["localrecv"] + 4  # one second less than 5 second
-            and device["localfail"] < 3  # no more than 3 times
-        ):
+            delay = self.run_scheduled(time.time())
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def schedule(self, device: XDevice, ts: float):
+        """Schedule device update at ts. Do nothing if it's already scheduled
+        earlier. Small random jitter smooths out the load on the network.
+        """
+        did = device["deviceid"]
+        due = self.schedule_due.get(did)
+        if due is not None and due <= ts:
+            return
+
+        if ts:
+            ts += random.random() * SCHEDULE_JITTER
+        self.schedule_due[did] = ts
+        heapq.heappush(self.schedule_heap, (ts, did))
+
+        if self.schedule_heap[0][1] == did:
+            self.wakeup.set()  # wake up run_forever before its next deadline
+
+    def ping_now(self, device: XDevice):
+        device.localping = 0  # instant local ping request
+        self.schedule(device, 0)
+
+    def run_scheduled(self, ts: float) -> float:
+        """Process all devices with deadline. Return delay to the next one."""
+        heap = self.schedule_heap
+        while heap and heap[0][0] <= ts:
+            due, did = heapq.heappop(heap)
+            if self.schedule_due.get(did) != due:
+                continue  # device was rescheduled earlier
+            del self.schedule_due[did]
+
+            if not (device := self.devices.get(did)):
+                continue
+            try:
+                if device.local is not None:
+                    self.schedule(device, self.update_local(device, ts))
+                elif parent := self.get_parent(device):
+                    # children are scheduled only when parent is SPM-Main (128)
+                    if parent.get("localtype") == "meter":
+                        self.update_local_child(parent, device)
+                        self.schedule(device, ts + SCHEDULE_INTERVAL)
+            except Exception as e:
+                _LOGGER.warning("run_forever", exc_info=e)
+
+        return min(heap[0][0] - ts, SCHEDULE_INTERVAL) if heap else SCHEDULE_INTERVAL
+
+    def update_local(self, device: XDevice, ts: float) -> float:
+        """Send local update requests if needed. Return next update time."""
+        poll = None
+        if device.localfail < 3:  # no more than 3 times
             uiid = device["extra"]["uiid"]
             # TH10R2 (15) and THR316D/THR320D (181) shouldn't be here, but anyway
             if uiid in (15, 32, 181, 182, 190, 262, 277):
                 if led := device["params"].get("sledOnline"):
-                    params = {"sledOnline": led}
-                    asyncio.create_task(self.send_local(device, "sledonline", params))
-                    return
+                    poll = ("sledonline", {"sledOnline": led})
             elif uiid == 126:
-                asyncio.create_task(self.send_local(device, "statistics"))
-                return
+                poll = ("statistics", None)
+
+        # 1. Update sensors data for Power and TH devices if we haven't received them
+        #    for more than 5 seconds.
+        if poll and ts >= device.localrecv + 4:  # one second less than 5 second
+            asyncio.create_task(self.send_local(device, *poll))
+            return ts + SCHEDULE_INTERVAL
 
         # 2. Update local availability for all local devices (online and offline).
-        if ts >= device["localping"]:
+        if ts >= device.localping:
             asyncio.create_task(self.send_local(device))
+            return ts + SCHEDULE_INTERVAL
+
+        if poll:
+            return min(device.localping, device.localrecv + 4)
+        return device.localping
 
-    def update_local_child(self, parent: XDevice | dict, device: XDevice):
+    def schedule_children(self, device: XDevice):
+        """Start updates for childrens when main device becomes local."""
+        # Support childrens only for SPM-Main (128)
+        if device.get("localtype") == "meter":
+            due = time.time() + SCHEDULE_INTERVAL
+            for child in self.children.get(device["deviceid"], {}).values():
+                self.schedule(child, due)
+
+    def update_local_child(self, parent: XDevice, device: XDevice):
         # 3. Update sensors data for SPM-Main childrens.
-        if parent["localfail"] >= 3:
+        if parent.localfail >= 3:
             return
         outlet = device.get("active_outlet", 0)
         device["active_outlet"] = outlet + 1 if outlet < 3 else 0
@@ -360,46 +798,80 @@ class XRegistry(XRegistryBase):
         }
         asyncio.create_task(self.send_local(parent, "uiActive", params))
 
+    def dispatcher_send(self, signal: str, *args, **kwargs):
+        # device availability can't change while its entities process one
+        # update, so it is calculated once for all of them
+        cache = self.available_cache
+        self.available_cache = {}
+        try:
+            super().dispatcher_send(signal, *args, **kwargs)
+        finally:
+            self.available_cache = cache
+
+    def connection(self, device: XDevice) -> tuple[bool, bool]:
+        """Return cloud and local connection state of device."""
+        if self.available_cache is None:
+            return bool(self.can_cloud(device)), bool(self.can_local(device))
+
+        did = device["deviceid"]
+        ok = self.available_cache.get(did)
+        if ok is None:
+            ok = bool(self.can_cloud(device)), bool(self.can_local(device))
+            self.available_cache[did] = ok
+        return ok
+
+    def available(self, device: XDevice) -> bool:
+        return any(self.connection(device))
+
     def can_cloud(self, device: XDevice) -> bool:
         if not self.cloud.online:
             return False
         return device.get("online")
 
+    def get_parent(self, device: XDevice) -> XDevice | None:
+        if parentid := self.parents.get(device["deviceid"]):
+            return self.devices.get(parentid)
+        return None
+
     def can_local(self, device: XDevice) -> bool:
         if not self.local.online:
             return False
-        if parent := device.get("parent"):
+        if parent := self.get_parent(device):
             # Known local parents - SPM-Main, RFBridge and ZBBridge-P
             # But ZBBridge-P can't control local devices
             if parent.get("localtype") in ("meter", "rf"):
-                return parent.get("local")
-        return device.get("local")
+                return parent.local
+        return device.local
 
     async def send_local(
         self, device: XDevice, command: str = None, params: dict = None
     ):
-        ok = await self.local.send(device, params, command)
+        async with self.semaphore:
+            ok = await self.route(device).send(
+                "local", self.local.send(device, params, command, background=True)
+            )
         if ok == "online":
-            if not device["local"]:
-                device["local"] = True
+            if not device.local:
+                device.local = True
                 did = device["deviceid"]
                 _LOGGER.debug(f"{did} !! Local4 | Device online")
                 self.dispatcher_send(did)
+                self.schedule_children(device)
 
-            device["localfail"] = 0
-            device["localping"] = time.time() + 59
+            device.localfail = 0
+            device.localping = time.time() + 59
             return
 
-        device["localfail"] += 1
+        device.localfail += 1
 
         # requests with command (sledonline or statistics) can't fail device to offline
-        if command or device["localfail"] < 3:
+        if command or device.localfail < 3:
             return
 
-        if device["local"]:
-            device["local"] = False
+        if device.local:
+            device.local = False
             did = device["deviceid"]
             _LOGGER.debug(f"{did} !! Local4 | Device offline")
             self.dispatcher_send(did)
 
-        device["localping"] = time.time() + 59
+        device.localping = time.time() + 59
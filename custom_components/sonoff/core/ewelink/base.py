@@ -1,6 +1,7 @@
 import asyncio
+import bisect
 import time
-from typing import Callable, Optional, TypedDict
+from typing import Callable
 
 from aiohttp import ClientSession
 
@@ -8,44 +9,160 @@ SIGNAL_CONNECTED = "connected"
 SIGNAL_UPDATE = "update"
 
 
-class XDevice(TypedDict, total=False):
-    deviceid: str
-    extra: dict
-    name: str
-    params: dict
-
-    brandName: Optional[str]
-    productModel: Optional[str]
-
-    online: Optional[bool]  # required for cloud
-    apikey: Optional[str]  # required for cloud
-
-    local: Optional[bool]  # required for local
-    localtype: Optional[str]  # exist for local DIY device type
-    host: Optional[str]  # required for local
-    devicekey: Optional[str]  # required for encrypted local devices (not DIY)
-
-    params_bulk: Optional[dict]  # helper for send_bulk commands
-    active_outlet: Optional[int]  # required for SPM-4Relay power updates
-    active_energy: Optional[list]  # required for multichannel energy
-
-    localfail: Optional[int]
-    localrecv: Optional[float]
-    localping: Optional[float]
-
+# hot transport state of device, changes with every message and scheduler tick
+XDEVICE_STATE = frozenset(
+    ("local", "localfail", "localping", "localrecv", "cloud_seq", "local_seq")
+)
+
+
+class XDevice(dict):
+    """Device from cloud or DIY device from LAN. Cold metadata is stored as dict
+    items, hot transport state - in slots. Dict interface works for both, so
+    `device["local"]` and `device.local` are the same. Unset state is None.
+
+    Dict items:
+    - deviceid: str
+    - extra: dict
+    - name: str
+    - params: dict
+    - brandName: Optional[str]
+    - productModel: Optional[str]
+    - online: Optional[bool] - required for cloud
+    - apikey: Optional[str] - required for cloud
+    - localtype: Optional[str] - exist for local DIY device type
+    - host: Optional[str] - required for local
+    - devicekey: Optional[str] - required for encrypted local devices (not DIY)
+    - params_bulk: Optional[dict] - helper for send_bulk commands
+    - active_outlet: Optional[int] - required for SPM-4Relay power updates
+    - active_energy: Optional[list] - required for multichannel energy
+    - parent: Optional[dict]
+    """
+
+    __slots__ = tuple(sorted(XDEVICE_STATE))
+
+    local: bool | None  # required for local
+    localfail: int | None
+    localping: float | None
+    localrecv: float | None
     cloud_seq: int | None  # sequence for update from cloud (if exists - cmd from app)
     local_seq: int | None  # sequence for update from local
 
-    parent: Optional[dict]
+    def __init__(self, *args, **kwargs):
+        self.local = self.localfail = self.localping = self.localrecv = None
+        self.cloud_seq = self.local_seq = None
+        self.update(*args, **kwargs)
+
+    def __missing__(self, key):
+        # called only for keys not from dict items, cold keys lookup is fast
+        if key in XDEVICE_STATE and (value := getattr(self, key)) is not None:
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in XDEVICE_STATE:
+            setattr(self, key, value)
+        else:
+            dict.__setitem__(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        if key in XDEVICE_STATE:
+            return getattr(self, key) is not None
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key in XDEVICE_STATE:
+            value = getattr(self, key)
+            return value if value is not None else default
+        return dict.get(self, key, default)
+
+    def setdefault(self, key, default=None):
+        if key in XDEVICE_STATE:
+            if (value := getattr(self, key)) is None:
+                setattr(self, key, value := default)
+            return value
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        items = dict(*args, **kwargs)
+        for key in XDEVICE_STATE.intersection(items):
+            setattr(self, key, items.pop(key))
+        dict.update(self, items)
+
+    def pop(self, key, *args):
+        if key in XDEVICE_STATE:
+            value = getattr(self, key)
+            setattr(self, key, None)
+            if value is not None:
+                return value
+            if args:
+                return args[0]
+            raise KeyError(key)
+        return dict.pop(self, key, *args)
+
+    def state(self) -> dict:
+        """Return hot state as dict, only set values."""
+        return {k: v for k in self.__slots__ if (v := getattr(self, k)) is not None}
+
+
+class XHistogram:
+    """Response time stats: success rate, EWMA and small histogram for
+    percentiles. Old values are slowly forgotten, so stats follow changes.
+    """
+
+    buckets = (0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)  # seconds
+    alpha = 0.2
+    window = 200
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.ok = 1.0  # success rate (EWMA)
+        self.rtt: float | None = None  # response time (EWMA)
+
+    def add(self, ok: bool, rtt: float = None):
+        self.ok += self.alpha * (ok - self.ok)
+        if not ok or rtt is None:
+            return
+
+        self.rtt = rtt if self.rtt is None else self.rtt + self.alpha * (rtt - self.rtt)
+
+        self.counts[bisect.bisect_left(self.buckets, rtt)] += 1
+        self.total += 1
+        if self.total >= self.window:
+            self.counts = [i // 2 for i in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, p: float) -> float | None:
+        """Return upper bound of bucket for p (0..1) percentile."""
+        if not self.total:
+            return None
+        limit = self.total * p
+        for i, count in enumerate(self.counts):
+            limit -= count
+            if limit <= 0:
+                break
+        return self.buckets[i] if i < len(self.buckets) else float("inf")
+
+    def diagnostics(self) -> dict:
+        return {
+            "ok": round(self.ok, 2),
+            "rtt": round(self.rtt, 3) if self.rtt is not None else None,
+            "p95": self.percentile(0.95),
+            "hist": self.counts,
+        }
 
 
 class XRegistryBase:
-    dispatcher: dict[str, list[Callable]] = None
+    # ordered sets of targets for each signal
+    dispatcher: dict[str, dict[Callable, None]] = None
+    # targets index for each signal: param => targets (None => all params)
+    dispatcher_index: dict[str, dict[str | None, dict[Callable, None]]] = None
     _sequence: int = 0
     _sequence_lock: asyncio.Lock = asyncio.Lock()
 
     def __init__(self, session: ClientSession):
         self.dispatcher = {}
+        self.dispatcher_index = {}
         self.session = session
 
     @staticmethod
@@ -59,16 +176,42 @@ class XRegistryBase:
                 XRegistryBase._sequence += 1
             return str(XRegistryBase._sequence)
 
-    def dispatcher_connect(self, signal: str, target: Callable) -> Callable:
-        targets = self.dispatcher.setdefault(signal, [])
-        if target not in targets:
-            targets.append(target)
-        return lambda: targets.remove(target)
+    def dispatcher_connect(
+        self, signal: str, target: Callable, params: set = None
+    ) -> Callable:
+        """Connect target to signal. Target with params will be called only for
+        updates with any of these params and for updates without params.
+        """
+        targets = self.dispatcher.setdefault(signal, {})
+        targets[target] = None
+
+        index = self.dispatcher_index.setdefault(signal, {})
+        keys = params if params is not None else (None,)
+        for key in keys:
+            index.setdefault(key, {})[target] = None
+
+        def disconnect():
+            targets.pop(target, None)
+            for k in keys:
+                index[k].pop(target, None)
+
+        return disconnect
 
     def dispatcher_send(self, signal: str, *args, **kwargs):
-        if not self.dispatcher.get(signal):
+        """Send signal to all targets. If first arg is params dict - send it only
+        to targets subscribed to any of these params.
+        """
+        if not (targets := self.dispatcher.get(signal)):
             return
-        for handler in self.dispatcher[signal]:
+        if args and isinstance(params := args[0], dict) and params:
+            index = self.dispatcher_index[signal]
+            handlers = dict(index.get(None, {}))
+            for key in params:
+                if key in index:
+                    handlers.update(index[key])
+        else:
+            handlers = targets.copy()
+        for handler in handlers:
             handler(*args, **kwargs)
 
     async def dispatcher_wait(self, signal: str):
@@ -9,6 +9,7 @@ import hmac
 import json
 import logging
 import time
+from collections import deque
 
 from aiohttp import (
     ClientConnectorError,
@@ -17,7 +18,14 @@ from aiohttp import (
     WSMessage,
 )
 
-from .base import SIGNAL_CONNECTED, SIGNAL_UPDATE, XDevice, XRegistryBase
+from . import codec
+from .base import (
+    SIGNAL_CONNECTED,
+    SIGNAL_UPDATE,
+    XDevice,
+    XHistogram,
+    XRegistryBase,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -256,7 +264,13 @@ class AuthError(Exception):
 class ResponseWaiter:
     """Class wait right sequences in response messages."""
 
-    _waiters: dict[str, asyncio.Future] = {}
+    max_waiters = 100  # max in-flight requests with response waiting
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters: dict[str, asyncio.Future] = {}
+        self.responses = XHistogram()
+        self.timeouts = 0
 
     def _set_response(self, sequence: str, error: int) -> bool:
         if sequence not in self._waiters:
@@ -270,20 +284,118 @@ class ResponseWaiter:
         except Exception:
             return False
 
-    async def _wait_response(self, sequence: str, timeout: float):
-        self._waiters[sequence] = fut = asyncio.get_event_loop().create_future()
-
+    def _add_waiter(self, sequence: str) -> asyncio.Future | None:
+        """Register waiter before sending the request, so fast response won't
+        be lost. Returns None if there are too many requests in-flight.
+        """
+        if len(self._waiters) >= self.max_waiters:
+            return None
+        self._waiters[sequence] = fut = asyncio.get_running_loop().create_future()
+        return fut
+
+    async def _wait_response(self, sequence: str, fut: asyncio.Future, timeout: float):
+        # limit future wait time without extra task from asyncio.wait_for
+        handle = asyncio.get_running_loop().call_later(
+            timeout, lambda: fut.done() or fut.set_result("timeout")
+        )
+        ts = time.time()
         try:
-            # limit future wait time
-            await asyncio.wait_for(fut, timeout)
-        except asyncio.TimeoutError:
-            return "timeout"
+            result = await fut
         finally:
+            handle.cancel()
             # remove future from waiters
             _ = self._waiters.pop(sequence, None)
 
-        # remove future from waiters and return result
-        return fut.result()
+        if result == "timeout":
+            self.timeouts += 1
+            self.responses.add(False)
+        else:
+            self.responses.add(True, time.time() - ts)
+
+        return result
+
+    def diagnostics(self) -> dict:
+        return {
+            "pending": len(self._waiters),
+            "timeouts": self.timeouts,
+            "responses": self.responses.diagnostics(),
+        }
+
+
+class XTokenBucket:
+    """Token bucket rate limiter. Waiting requests are released in FIFO order,
+    user requests always before background ones.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.ts = 0  # last refill time (loop time)
+        self.lanes: tuple[deque, deque] = (deque(), deque())  # user, background
+        self.handle: asyncio.TimerHandle | None = None
+
+        self.total = 0
+        self.wait_max = 0
+        self.wait_sum = 0
+
+    def _refill(self, ts: float):
+        self.tokens = min(self.burst, self.tokens + (ts - self.ts) * self.rate)
+        self.ts = ts
+
+    def _release(self):
+        self.handle = None
+
+        loop = asyncio.get_running_loop()
+        self._refill(loop.time())
+
+        for lane in self.lanes:
+            while lane and self.tokens >= 1:
+                fut = lane.popleft()
+                if not fut.done():
+                    fut.set_result(None)
+                    self.tokens -= 1
+
+        if any(self.lanes):
+            delay = (1 - self.tokens) / self.rate
+            self.handle = loop.call_later(delay, self._release)
+
+    async def acquire(self, background: bool = False) -> float:
+        """Wait for token. Return wait time."""
+        loop = asyncio.get_running_loop()
+        ts = loop.time()
+        self._refill(ts)
+        self.total += 1
+
+        if self.tokens >= 1 and not any(self.lanes):
+            self.tokens -= 1
+            return 0
+
+        fut = loop.create_future()
+        self.lanes[background].append(fut)
+        if self.handle is None:
+            self._release()
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # cancelled future will be skipped by _release
+            if not fut.cancelled():
+                self.tokens += 1  # return unused token
+            raise
+
+        wait = loop.time() - ts
+        self.wait_max = max(self.wait_max, wait)
+        self.wait_sum += wait
+        return wait
+
+    def diagnostics(self) -> dict:
+        return {
+            "queue": [len(lane) for lane in self.lanes],
+            "total": self.total,
+            "wait_max": round(self.wait_max, 3),
+            "wait_avg": round(self.wait_sum / self.total, 3) if self.total else 0,
+        }
 
 
 def sign(msg: bytes) -> bytes:
@@ -300,14 +412,31 @@ def sign(msg: bytes) -> bytes:
 class XRegistryCloud(ResponseWaiter, XRegistryBase):
     auth: dict | None = None
     devices: dict[str, dict] = None
-    last_ts: float = 0
-    last_ui_active: float = 0
     online: bool | None = None
+    rate: float = 10  # commands per second
+    burst: int = 1
+
+    get_devices_limit = 4  # parallel requests for homes
+    get_devices_page = 0  # devices per request, 0 - all devices
     region: str = None
 
     task: asyncio.Task | None = None
     ws: ClientWebSocketResponse = None
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # protect cloud from DDoS (it can break connection)
+        self.limiter = XTokenBucket(self.rate, self.burst)
+        # protect from fast switching uiActive param (device may not respond)
+        self.limiter_ui = XTokenBucket(1)
+
+    def diagnostics(self) -> dict:
+        return {
+            **super().diagnostics(),
+            "limiter": self.limiter.diagnostics(),
+            "limiter_ui": self.limiter_ui.diagnostics(),
+        }
+
     @property
     def host(self) -> str:
         return API[self.region]
@@ -398,25 +527,63 @@ class XRegistryCloud(ResponseWaiter, XRegistryBase):
         return {i["id"]: i["name"] for i in resp["data"]["familyList"]}
 
     async def get_devices(self, homes: list = None) -> list[dict]:
+        """Load devices from all homes in parallel. Devices shared between
+        homes will be returned once.
+        """
+        semaphore = asyncio.Semaphore(self.get_devices_limit)
+
+        async def get_home(home: str | None) -> list[dict]:
+            async with semaphore:
+                return await self.get_home_devices(home)
+
+        results = await asyncio.gather(*[get_home(home) for home in homes or [None]])
+
+        devices = {}
+        for items in results:
+            for device in items:
+                devices.setdefault(device["deviceid"], device)
+        return list(devices.values())
+
+    async def get_home_devices(self, home: str = None) -> list[dict]:
+        """Load devices from one home. Big lists are loaded by pages."""
         devices = []
-        for home in homes or [None]:
+        index = 0
+        while True:
+            params = {"num": self.get_devices_page}
+            if index:
+                params["beginIndex"] = index
+            if home:
+                params["familyid"] = home
+
+            ts = time.time()
             r = await self.session.get(
                 self.host + "/v2/device/thing",
                 headers=self.headers,
                 timeout=10,
-                params={"num": 0, "familyid": home} if home else {"num": 0},
+                params=params,
             )
             resp = await r.json()
+            _LOGGER.debug(
+                f"Load devices for home {home} from {index} in {time.time() - ts:.3f}s"
+            )
+
             if resp["error"] != 0:
                 raise Exception(resp["msg"])
+
+            things = resp["data"]["thingList"]
             # item type: 1 - user device, 2 - shared device, 3 - user group,
             # 5 - share device (home)
             devices += [
                 i["itemData"]
-                for i in resp["data"]["thingList"]
+                for i in things
                 if "deviceid" in i["itemData"]  # skip groups
             ]
-        return devices
+
+            # zero page size - all devices at once, a full page - maybe there
+            # are more devices (total from the cloud is not reliable)
+            index += len(things)
+            if not self.get_devices_page or len(things) < self.get_devices_page:
+                return devices
 
     async def set_device(self, device: XDevice, params: dict, timeout: float = 5):
         did = device["deviceid"]
@@ -438,26 +605,23 @@ class XRegistryCloud(ResponseWaiter, XRegistryBase):
         params: dict = None,
         sequence: str = None,
         timeout: float = 5,
+        background: bool = False,
     ):
         """With params - send new state to device, without - request device
-        state. With zero timeout - won't wait response.
+        state. With zero timeout - won't wait response. Background requests
+        wait until all user requests are sent.
         """
         log = f"{device['deviceid']} => Cloud4 | "
         if params:
             log += f"{params} | "
 
-        # protect from fast switching uiActive param (device may not respond)
         # https://github.com/AlexxIT/SonoffLAN/issues/1366
         if params and "uiActive" in params:
-            while (delay := self.last_ui_active + 1.0 - time.time()) > 0:
-                await asyncio.sleep(delay)
-            self.last_ui_active = time.time()
+            await self.limiter_ui.acquire()
+            background = True
 
-        # protect cloud from DDoS (it can break connection)
-        while (delay := self.last_ts + 0.1 - time.time()) > 0:
+        if await self.limiter.acquire(background):
             log += "DDoS | "
-            await asyncio.sleep(delay)
-        self.last_ts = time.time()
 
         if sequence is None:
             sequence = await self.sequence()
@@ -479,11 +643,22 @@ class XRegistryCloud(ResponseWaiter, XRegistryBase):
                 "sequence": sequence,
             }
 
-            await self.ws.send_json(payload)
+            if not timeout:
+                await self.ws.send_json(payload)
+                return
+
+            if not (fut := self._add_waiter(sequence)):
+                _LOGGER.warning(f"{log} | too many requests in-flight")
+                return "E#BSY"
+
+            try:
+                await self.ws.send_json(payload)
+            except Exception:
+                _ = self._waiters.pop(sequence, None)
+                raise
 
-            if timeout:
-                # wait for response with same sequence
-                return await self._wait_response(sequence, timeout)
+            # wait for response with same sequence
+            return await self._wait_response(sequence, fut, timeout)
         except ConnectionResetError:
             return "offline"
         except Exception as e:
@@ -540,8 +715,12 @@ class XRegistryCloud(ResponseWaiter, XRegistryBase):
                         continue
                     if isinstance(msg.data, ServerTimeoutError):
                         raise msg.data
-                    resp = json.loads(msg.data)
-                    _ = asyncio.create_task(self._process_ws_msg(resp))
+                    resp = codec.loads(msg.data)
+                    # process in the same order as received, without extra task
+                    try:
+                        self._process_ws_msg(resp)
+                    except Exception as e:
+                        _LOGGER.warning(f"Cloud msg error: {resp}", exc_info=e)
             except ServerTimeoutError:
                 pass
             except Exception as e:
@@ -601,7 +780,7 @@ class XRegistryCloud(ResponseWaiter, XRegistryBase):
 
         return False
 
-    async def _process_ws_msg(self, data: dict):
+    def _process_ws_msg(self, data: dict):
         if "action" not in data:
             # response on our command
             if "sequence" in data:
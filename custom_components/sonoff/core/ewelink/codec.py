@@ -0,0 +1,21 @@
+"""JSON codec for LAN, Cloud and mDNS payloads. Uses orjson if installed (it
+comes with Home Assistant), or the standard library otherwise.
+"""
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: bytes | str):
+        return orjson.loads(data)
+
+except ImportError:
+    import json
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    def loads(data: bytes | str):
+        return json.loads(data)
@@ -0,0 +1,55 @@
+"""Hosts for active LAN discovery, for networks where mDNS doesn't work."""
+
+import ipaddress
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# don't sweep huge subnets by mistake, /22 is about 1000 hosts
+MAX_HOSTS = 1024
+
+
+def arp_hosts(path: str = "/proc/net/arp") -> list[str]:
+    """Return IPv4 addresses with complete entries from the Linux ARP table."""
+    try:
+        with open(path) as f:
+            lines = f.readlines()[1:]
+    except OSError:
+        return []
+
+    hosts = []
+    for line in lines:
+        # IP address, HW type, Flags, HW address, Mask, Device
+        items = line.split()
+        if len(items) >= 4 and items[2] != "0x0" and items[3] != "00:00:00:00:00:00":
+            hosts.append(items[0])
+    return hosts
+
+
+def discovery_hosts(items: list[str], arp_path: str = "/proc/net/arp") -> list[str]:
+    """Return hosts for discovery from config items. Item can be a subnet
+    (192.168.1.0/24), a single host (192.168.1.50) or `arp` for hosts from
+    the ARP table. Order is kept, duplicates are removed.
+    """
+    hosts = {}
+    for item in items:
+        if item == "arp":
+            hosts.update(dict.fromkeys(arp_hosts(arp_path)))
+            continue
+
+        try:
+            net = ipaddress.IPv4Network(item, strict=False)
+        except ValueError:
+            _LOGGER.warning(f"Wrong discovery subnet: {item}")
+            continue
+
+        if net.num_addresses > MAX_HOSTS:
+            _LOGGER.warning(f"Discovery subnet is too big: {item}")
+            continue
+
+        if net.num_addresses == 1:
+            hosts[str(net.network_address)] = None
+        else:
+            hosts.update(dict.fromkeys(str(i) for i in net.hosts()))
+
+    return list(hosts)
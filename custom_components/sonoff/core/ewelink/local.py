@@ -6,35 +6,50 @@ devices and their devicekey.
 
 import asyncio
 import base64
+import contextlib
 import errno
+import functools
 import hashlib
+import heapq
 import ipaddress
-import json
+import itertools
 import logging
 import os
+import time
 
 import aiohttp
+from aiohttp import ClientSession
 from aiohttp.hdrs import CONTENT_TYPE
-from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from zeroconf import ServiceStateChange, Zeroconf
 from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo
 
+from . import codec
 from .base import SIGNAL_CONNECTED, SIGNAL_UPDATE, XDevice, XRegistryBase
 
 _LOGGER = logging.getLogger(__name__)
 
+_counter = itertools.count()  # FIFO order for requests with same priority
+
+# request was cancelled or connection was closed by the device
+ERROR_CLOSED = "E#COS"
+
+
+@functools.lru_cache(maxsize=256)
+def aes_key(devicekey: str) -> algorithms.AES:
+    """Cached AES key for devicekey. New devicekey will get new cache item."""
+    return algorithms.AES(hashlib.md5(devicekey.encode("utf-8")).digest())
+
 
 def encrypt(payload: dict, devicekey: str):
-    plaintext = json.dumps(payload["data"]).encode("utf-8")
-    key = hashlib.md5(devicekey.encode("utf-8")).digest()
+    plaintext = codec.dumps(payload["data"])
     iv = os.urandom(16)
 
-    padder = padding.PKCS7(128).padder()
-    padded_data = padder.update(plaintext) + padder.finalize()
+    # PKCS7 padding
+    size = 16 - len(plaintext) % 16
+    padded_data = plaintext + bytes((size,)) * size
 
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
-    encryptor = cipher.encryptor()
+    encryptor = Cipher(aes_key(devicekey), modes.CBC(iv)).encryptor()
     ciphertext = encryptor.update(padded_data) + encryptor.finalize()
 
     payload["encrypt"] = True
@@ -46,22 +61,164 @@ def encrypt(payload: dict, devicekey: str):
 
 def decrypt(payload: dict, devicekey: str):
     ciphertext = base64.b64decode(payload["data"])
-    key = hashlib.md5(devicekey.encode("utf-8")).digest()
     iv = base64.b64decode(payload["iv"])
 
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv))
-    decryptor = cipher.decryptor()
+    decryptor = Cipher(aes_key(devicekey), modes.CBC(iv)).decryptor()
     padded_data = decryptor.update(ciphertext) + decryptor.finalize()
 
-    unpadder = padding.PKCS7(128).unpadder()
-    return unpadder.update(padded_data) + unpadder.finalize()
+    # PKCS7 unpadding
+    size = padded_data[-1] if padded_data else 0
+    if not 0 < size <= 16 or padded_data[-size:] != bytes((size,)) * size:
+        raise ValueError("Invalid padding bytes.")
+    return padded_data[:-size]
+
+
+class XLocalPool:
+    """Keep-alive HTTP connections to LAN devices, one connection per device.
+
+    Device web server can close idle connection at any moment. If this happens
+    with reused connection - request will be repeated with new connection. If
+    this happens too often - device will be switched to `Connection: close` mode.
+    """
+
+    max_fails = 3
+
+    def __init__(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connect)
+        trace.on_connection_reuseconn.append(self._on_reuse)
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=1),
+            trace_configs=[trace],
+        )
+        self.stats: dict[str, dict] = {}
+
+    def can_keepalive(self, deviceid: str) -> bool:
+        stats = self.stats.get(deviceid)
+        return stats is None or stats["fails"] < self.max_fails
+
+    async def post(self, deviceid: str, url: str, payload: dict, timeout: float):
+        stats = self.stats.setdefault(
+            deviceid, {"connect": 0, "reuse": 0, "reconnect": 0, "fails": 0}
+        )
+        ctx = {"stats": stats, "reused": False}
+        try:
+            r = await self.session.post(
+                url, json=payload, timeout=timeout, trace_request_ctx=ctx
+            )
+            if ctx["reused"]:
+                stats["fails"] = 0  # count only fails in a row
+            return r
+        except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError):
+            if not ctx["reused"]:
+                raise
+
+        # device closed reused connection, repeat request with new connection
+        stats["fails"] += 1
+        stats["reconnect"] += 1
+        ctx["reused"] = False
+        return await self.session.post(
+            url, json=payload, timeout=timeout, trace_request_ctx=ctx
+        )
+
+    async def close(self):
+        await self.session.close()
+
+    @staticmethod
+    async def _on_connect(session, context, params):
+        context.trace_request_ctx["stats"]["connect"] += 1
+
+    @staticmethod
+    async def _on_reuse(session, context, params):
+        context.trace_request_ctx["stats"]["reuse"] += 1
+        context.trace_request_ctx["reused"] = True
+
+
+class XLocalQueue:
+    """Device web server can process only one request at a time. So all requests
+    to one device are sent one by one. User commands go before background ones.
+    """
+
+    def __init__(self):
+        self.busy = False
+        self.state: asyncio.Future | None = None  # active getState request
+        self.waiters: list[tuple[bool, int, asyncio.Future]] = []
+
+        self.total = 0
+        self.merged = 0
+        self.depth_max = 0
+        self.wait_max = 0.0
+        self.wait_sum = 0.0
+
+    @contextlib.asynccontextmanager
+    async def lock(self, background: bool = False, timeout: float = None):
+        """Wait for own turn. Raise asyncio.TimeoutError if it takes more than
+        timeout seconds.
+        """
+        ts = time.time()
+
+        if self.busy:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (background, next(_counter), fut))
+            self.depth_max = max(self.depth_max, len(self.waiters))
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                if fut.done() and not fut.cancelled():
+                    self.release()  # lock was already passed to us
+                raise
+        else:
+            self.busy = True
+
+        wait = time.time() - ts
+        self.total += 1
+        self.wait_sum += wait
+        if wait > self.wait_max:
+            self.wait_max = wait
+
+        try:
+            yield
+        finally:
+            self.release()
+
+    def release(self):
+        while self.waiters:
+            _, _, fut = heapq.heappop(self.waiters)
+            if not fut.done():
+                fut.set_result(True)  # pass lock to next waiter
+                return
+        self.busy = False
+
+    def diagnostics(self) -> dict:
+        return {
+            "depth": len(self.waiters),
+            "depth_max": self.depth_max,
+            "total": self.total,
+            "merged": self.merged,
+            "wait_avg": round(self.wait_sum / self.total, 3) if self.total else 0,
+            "wait_max": round(self.wait_max, 3),
+        }
 
 
 class XRegistryLocal(XRegistryBase):
     browser: AsyncServiceBrowser = None
+    keepalive: bool = False  # use XLocalPool for requests to devices
     online: bool = False
+    pool: XLocalPool = None
+
+    def __init__(self, session: ClientSession):
+        super().__init__(session)
+        self.queues: dict[str, XLocalQueue] = {}
+        # zeroconf names in resolving: name => repeat after current resolving
+        self.resolving: dict[str, bool] = {}
+        self.zeroconf = {"events": 0, "merged": 0, "cache": 0, "requests": 0}
+        self.discovery = {"probes": 0, "found": 0}
 
     def start(self, zeroconf: Zeroconf):
+        if self.keepalive:
+            self.pool = XLocalPool()
+
         self.browser = AsyncServiceBrowser(
             zeroconf, "_ewelink._tcp.local.", [self._handler1]
         )
@@ -74,6 +231,18 @@ class XRegistryLocal(XRegistryBase):
         self.online = False
         await self.browser.async_cancel()
 
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    def diagnostics(self) -> dict:
+        return {
+            "keepalive": self.pool.stats if self.pool else None,
+            "queue": {k: v.diagnostics() for k, v in self.queues.items()},
+            "zeroconf": self.zeroconf,
+            "discovery": self.discovery,
+        }
+
     def _handler1(
         self,
         zeroconf: Zeroconf,
@@ -89,16 +258,41 @@ class XRegistryLocal(XRegistryBase):
         if not name.lower().startswith("ewelink"):
             return
 
+        self.zeroconf["events"] += 1
+
+        # chatty devices can send many events, so only one resolving for each
+        # name at the same time, and one more after it for all new events
+        if name in self.resolving:
+            self.resolving[name] = True
+            self.zeroconf["merged"] += 1
+            return
+
+        self.resolving[name] = False
         asyncio.create_task(self._handler2(zeroconf, service_type, name))
 
     async def _handler2(self, zeroconf: Zeroconf, service_type: str, name: str):
         """Step 2. Request additional info about add and update event from device."""
+        try:
+            while True:
+                await self._resolve(zeroconf, service_type, name)
+                if not self.resolving.get(name):
+                    break
+                self.resolving[name] = False
+        finally:
+            self.resolving.pop(name, None)
+
+    async def _resolve(self, zeroconf: Zeroconf, service_type: str, name: str):
         deviceid = name[8:18]
         try:
             info = AsyncServiceInfo(service_type, name)
-            if not await info.async_request(zeroconf, 3000) or not info.properties:
-                _LOGGER.debug(f"{deviceid} <= Local0 | Can't get zeroconf info")
-                return
+            # use fresh records from zeroconf cache without network request
+            if info.load_from_cache(zeroconf) and info.properties:
+                self.zeroconf["cache"] += 1
+            else:
+                self.zeroconf["requests"] += 1
+                if not await info.async_request(zeroconf, 3000) or not info.properties:
+                    _LOGGER.debug(f"{deviceid} <= Local0 | Can't get zeroconf info")
+                    return
 
             # support update with empty host and host without port
             for addr in info.addresses:
@@ -141,10 +335,76 @@ class XRegistryLocal(XRegistryBase):
             msg["data"] = raw
             msg["iv"] = data["iv"]
         elif raw:  # no data field from zbbridgeu
-            msg["params"] = json.loads(raw)
+            msg["params"] = codec.loads(raw)
 
         self.dispatcher_send(SIGNAL_UPDATE, msg)
 
+    async def discover(
+        self, hosts: list[str], timeout: float = 2, limit: int = 64
+    ) -> int:
+        """Active discovery without mDNS. Request state from each host and
+        process responses with deviceid as LAN messages. Return number of
+        found devices.
+
+        :param timeout: for each host, most of the hosts will never respond
+        :param limit: number of simultaneous requests
+        """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def probe(host: str) -> bool:
+            if ":" not in host:
+                host += ":8081"
+
+            payload = {
+                "sequence": await self.sequence(),
+                "deviceid": "",
+                "selfApikey": "123",
+                "data": {},
+            }
+
+            async with semaphore:
+                self.discovery["probes"] += 1
+                try:
+                    # noinspection HttpUrlsUsage
+                    r = await self.session.post(
+                        f"http://{host}/zeroconf/getState",
+                        json=payload,
+                        headers={"Connection": "close"},
+                        timeout=timeout,
+                    )
+                    resp: dict = codec.loads(await r.read())
+                except Exception:
+                    return False
+
+            if not isinstance(resp, dict) or resp.get("error") != 0:
+                return False
+
+            deviceid = resp.get("deviceid")
+            if not deviceid or not resp.get("data"):
+                _LOGGER.debug(f"{host} <= Local5 | Unknown response: {resp}")
+                return False
+
+            _LOGGER.debug(f"{deviceid} <= Local5 | {host} | {resp}")
+
+            msg = {
+                "deviceid": deviceid,
+                "host": host,
+                "localtype": resp.get("type"),
+                "seq": resp.get("seq"),
+            }
+            if "iv" in resp:
+                msg["data"] = resp["data"]
+                msg["iv"] = resp["iv"]
+            else:
+                msg["params"] = resp["data"]
+
+            self.discovery["found"] += 1
+            self.dispatcher_send(SIGNAL_UPDATE, msg)
+            return True
+
+        results = await asyncio.gather(*[probe(host) for host in hosts])
+        return sum(results)
+
     async def send(
         self,
         device: XDevice,
@@ -152,8 +412,15 @@ class XRegistryLocal(XRegistryBase):
         command: str = None,
         sequence: str = None,
         timeout: int = 5,
-        cre_retry_counter: int = 10,
+        background: bool = False,
     ):
+        """Send command to device. Commands to one device are sent one by one.
+
+        :param timeout: for the whole command, with waiting for other commands
+          to the same device
+        :param background: optional, request from background update task, will
+          wait for all user commands to the same device
+        """
         # known commands for DIY: switch, startup, pulse, sledonline
         # other commands: switch, switches, transmit, dimmable, light, fan
 
@@ -163,6 +430,62 @@ class XRegistryLocal(XRegistryBase):
             # Even if the device doesn't support it, it will still respond in some way
             command = next(iter(params)) if params else "getState"
 
+        queue = self.queues.get(device["deviceid"])
+        if queue is None:
+            queue = self.queues[device["deviceid"]] = XLocalQueue()
+
+        if command != "getState" or params:
+            return await self._send_queued(
+                queue, background, device, params, command, sequence, timeout
+            )
+
+        # one getState request is enough for any number of callers
+        if queue.state:
+            queue.merged += 1
+            return await asyncio.shield(queue.state)
+
+        queue.state = state = asyncio.get_running_loop().create_future()
+        ok = ERROR_CLOSED
+        try:
+            ok = await self._send_queued(
+                queue, background, device, params, command, sequence, timeout
+            )
+            return ok
+        finally:
+            queue.state = None
+            state.set_result(ok)
+
+    async def _send_queued(
+        self,
+        queue: XLocalQueue,
+        background: bool,
+        device: XDevice,
+        params: dict,
+        command: str,
+        sequence: str,
+        timeout: float,
+    ):
+        deadline = time.monotonic() + timeout
+        try:
+            async with queue.lock(background, timeout):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return "timeout"
+                return await self._send(device, params, command, sequence, timeout)
+        except asyncio.TimeoutError:
+            did = device["deviceid"]
+            _LOGGER.debug(f"{did} => Local4 | {command} !! Queue timeout {timeout}")
+            return "timeout"
+
+    async def _send(
+        self,
+        device: XDevice,
+        params: dict,
+        command: str,
+        sequence: str = None,
+        timeout: int = 5,
+        cre_retry_counter: int = 10,
+    ):
         payload = {
             "sequence": sequence or await self.sequence(),
             "deviceid": device["deviceid"],
@@ -179,14 +502,16 @@ class XRegistryLocal(XRegistryBase):
 
         log = f"{device['deviceid']} => Local4 | {host} | {command} {params or {}}"
 
+        ts = time.monotonic()
         try:
             # noinspection HttpUrlsUsage
-            r = await self.session.post(
-                f"http://{host}/zeroconf/{command}",
-                json=payload,
-                headers={"Connection": "close"},
-                timeout=timeout,
-            )
+            url = f"http://{host}/zeroconf/{command}"
+            if self.pool and self.pool.can_keepalive(device["deviceid"]):
+                r = await self.pool.post(device["deviceid"], url, payload, timeout)
+            else:
+                r = await self.session.post(
+                    url, json=payload, headers={"Connection": "close"}, timeout=timeout
+                )
 
             try:
                 # some devices don't support getState command
@@ -197,7 +522,7 @@ class XRegistryLocal(XRegistryBase):
                         return "online"
                     return "error"
 
-                resp: dict = await r.json()
+                resp: dict = codec.loads(await r.read())
                 _LOGGER.debug(f"{log} <= {resp}")
                 if resp["error"] == 0:
                     if "iv" in resp:
@@ -224,6 +549,10 @@ class XRegistryLocal(XRegistryBase):
                 _LOGGER.debug(f"{log} !! Can't read JSON {e}")
                 return "error"
 
+            finally:
+                # return keep-alive connection to the pool
+                r.release()
+
         except asyncio.TimeoutError:
             _LOGGER.debug(f"{log} !! Timeout {timeout}")
             return "timeout"
@@ -242,15 +571,18 @@ class XRegistryLocal(XRegistryBase):
             # device is busy processing another request, it will close the
             # connection for the new request and we will get this error.
             #
-            # It appears that the device takes some time to process a new request
-            # after the previous one was closed, which caused a locking approach
-            # to not work across different devices. Simply retrying on this error
-            # a few times seems to fortunately work reliably, so we'll do that.
+            # Our own requests are serialized by XLocalQueue. But the device takes
+            # some time to process a new request after the previous one was
+            # closed, and it can also be busy with requests from other clients.
+            # Simply retrying on this error a few times seems to fortunately
+            # work reliably, so we'll do that.
 
             _LOGGER.debug(f"{log} !! ConnectionResetError")
-            if cre_retry_counter > 0:
+            # retries should fit in the same timeout
+            timeout -= time.monotonic() - ts + 0.1
+            if cre_retry_counter > 0 and timeout > 0:
                 await asyncio.sleep(0.1)
-                return await self.send(
+                return await self._send(
                     device, params, command, sequence, timeout, cre_retry_counter - 1
                 )
 
@@ -258,7 +590,7 @@ class XRegistryLocal(XRegistryBase):
 
         except (aiohttp.ServerDisconnectedError, asyncio.CancelledError) as e:
             _LOGGER.debug(log, exc_info=e)
-            return "E#COS"
+            return ERROR_CLOSED
 
         except Exception as e:
             _LOGGER.error(log, exc_info=e)
@@ -280,4 +612,4 @@ class XRegistryLocal(XRegistryBase):
         # Fix https://github.com/AlexxIT/SonoffLAN/issues/1160
         data = data.rstrip(b"\x02")
 
-        return json.loads(data)
+        return codec.loads(data)
@@ -5,6 +5,7 @@ from homeassistant.helpers.device_registry import DeviceEntry
 
 from .core import xutils
 from .core.const import DOMAIN, PRIVATE_KEYS
+from .core.entity import XEntity
 from .core.ewelink import XRegistry
 
 from copy import deepcopy
@@ -60,6 +61,8 @@ async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigE
         "options": options,
         "errors": xutils.system_log_records(hass, DOMAIN),
         "devices": devices,
+        "stats": registry.diagnostics(),
+        "writer": XEntity.writer.diagnostics() if XEntity.writer else None,
     }
 
 
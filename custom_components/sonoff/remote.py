@@ -75,6 +75,8 @@ def rfbridge_childs(remotes: list, config: dict = None):
 
 # noinspection PyAbstractClass
 class XRemote(XEntity, RemoteEntity):
+    params = {"cmd", "arming"}
+
     _attr_is_on = True
     childs: dict[str, Union[XRemoteButton, XRemoteSensor, XRemoteSensorOff]] = None
 
@@ -106,7 +108,6 @@ class XRemote(XEntity, RemoteEntity):
         # init bridge after childs for update available
         XEntity.__init__(self, ewelink, device)
 
-        self.params = {"cmd", "arming"}
         self.ts = None
 
     def set_state(self, params: dict):
@@ -1,4 +1,6 @@
 import asyncio
+import functools
+import sys
 import time
 from typing import Optional
 
@@ -200,6 +202,55 @@ class XHumidityTH(XSensor):
             XSensor.set_state(self)
 
 
+# digit value for each byte of energy history string, 255 - wrong digit
+HEX_DIGITS = bytes(
+    int(chr(b), 16) if chr(b) in "0123456789abcdefABCDEF" else 255 for b in range(256)
+)
+
+# energy history layouts: (weight in 0.01 kWh, base) for each char of one value,
+# None - skip char
+ENERGY_POW = ((1600, 16), (100, 16), None, (10, 10), None, (1, 10))
+ENERGY_DUALR3 = ((1600, 16), (100, 16), (10, 10), (1, 10))
+ENERGY_POWR3 = ((100, 16), (10, 10), (1, 10))
+
+
+@functools.lru_cache(maxsize=64)
+def decode_history(value: str, layout: tuple) -> Optional[tuple]:
+    """Decode energy history string with same layout for each value. Same
+    history can come from LAN and Cloud, so results are cached.
+    """
+    size = len(layout)
+    if not value or len(value) % size:
+        return None
+
+    digits = value.encode("ascii", "replace").translate(HEX_DIGITS)
+
+    # numpy is faster for long strings, but is used only if it's already loaded,
+    # because import takes more time than decoding
+    if np := sys.modules.get("numpy"):
+        weights, bases = zip(*(item or (0, 256) for item in layout))
+        items = np.frombuffer(digits, dtype=np.uint8).reshape(-1, size)
+        if (items >= np.array(bases)).any():
+            return None
+        weights = np.array(weights)
+        return tuple(((items @ weights) / 100).tolist())
+
+    values = None
+    for i, item in enumerate(layout):
+        if item is None:
+            continue
+        weight, base = item
+        column = digits[i::size]
+        if max(column) >= base:
+            return None
+        if values is None:
+            values = [weight * d for d in column]
+        else:
+            values = [v + weight * d for v, d in zip(values, column)]
+
+    return tuple(v / 100 for v in values)
+
+
 class XCloudEnergy(XEntity, SensorEntity):
     get_params = None
     next_ts = 0
@@ -215,20 +266,14 @@ class XCloudEnergy(XEntity, SensorEntity):
         reporting = device.get("reporting", {})
         self.report_dt, self.report_history = reporting.get(self.uid) or (3600, 0)
 
-    @staticmethod
-    def decode_energy(value: str) -> Optional[list]:
-        try:
-            return [
-                round(
-                    int(value[i : i + 2], 16)
-                    + int(value[i + 3], 10) * 0.1
-                    + int(value[i + 5], 10) * 0.01,
-                    2,
-                )
-                for i in range(0, len(value), 6)
-            ]
-        except Exception:
+    layout = ENERGY_POW
+
+    @classmethod
+    def decode_energy(cls, value: str) -> Optional[list]:
+        if not isinstance(value, str):
             return None
+        history = decode_history(value, cls.layout)
+        return list(history) if history else None
 
     def set_state(self, params: dict):
         history = self.decode_energy(params[self.param])
@@ -246,7 +291,9 @@ class XCloudEnergy(XEntity, SensorEntity):
         return self.available and self.ewelink.cloud.online
 
     async def get_update(self) -> bool:
-        ok = await self.ewelink.send_cloud(self.device, self.get_params, query=False)
+        ok = await self.ewelink.send_cloud(
+            self.device, self.get_params, query=False, background=True
+        )
         return ok == "online"
 
     async def async_update(self):
@@ -256,22 +303,12 @@ class XCloudEnergy(XEntity, SensorEntity):
 
 
 class XCloudEnergyDualR3(XCloudEnergy, SensorEntity):
+    layout = ENERGY_DUALR3
+
     def __init__(self, ewelink: XRegistry, device: dict):
         XCloudEnergy.__init__(self, ewelink, device)
         device.setdefault("active_energy", []).append(self.uid)
 
-    @staticmethod
-    def decode_energy(value: str) -> Optional[list]:
-        try:
-            return [
-                round(
-                    int(value[i : i + 2], 16) + int(value[i + 2 : i + 4], 10) * 0.01, 2
-                )
-                for i in range(0, len(value), 4)
-            ]
-        except Exception:
-            return None
-
     def can_update(self) -> bool:
         if XCloudEnergy.can_update(self):
             # Allow only one sensor update at a time
@@ -287,15 +324,7 @@ class XCloudEnergyDualR3(XCloudEnergy, SensorEntity):
 
 
 class XCloudEnergyPOWR3(XCloudEnergy, SensorEntity):
-    @staticmethod
-    def decode_energy(value: str) -> Optional[list]:
-        try:
-            return [
-                round(int(value[i], 16) + int(value[i + 1 : i + 3], 10) * 0.01, 2)
-                for i in range(0, len(value), 3)
-            ]
-        except Exception:
-            return None
+    layout = ENERGY_POWR3
 
     def can_update(self) -> bool:
         return self.available
@@ -541,8 +570,7 @@ class XConnection(XEntity, SensorEntity):
     _attr_entity_registry_enabled_default = False
 
     def internal_update(self, params: dict = None):
-        cloud = self.ewelink.can_cloud(self.device)
-        local = self.ewelink.can_local(self.device)
+        cloud, local = self.ewelink.connection(self.device)
 
         if cloud:
             value = "duplex" if local else "cloud"
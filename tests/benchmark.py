@@ -0,0 +1,390 @@
+"""Micro-benchmarks for integration hot paths. Not collected by pytest.
+
+Usage: python -m tests.benchmark [name ...]
+"""
+
+import sys
+import time
+
+
+def bench(name: str, func, number: int) -> float:
+    t = time.perf_counter()
+    for _ in range(number):
+        func()
+    t = time.perf_counter() - t
+    print(f"{name:40} {number / t:12,.0f} ops/s")
+    return t
+
+
+def crypto():
+    import base64
+    import hashlib
+    import json
+    import os
+
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    from custom_components.sonoff.core.ewelink.local import decrypt, encrypt
+
+    # previous implementation, without key cache and with padding objects
+    def encrypt_old(payload: dict, devicekey: str):
+        plaintext = json.dumps(payload["data"]).encode("utf-8")
+        key = hashlib.md5(devicekey.encode("utf-8")).digest()
+        iv = os.urandom(16)
+        padder = padding.PKCS7(128).padder()
+        padded_data = padder.update(plaintext) + padder.finalize()
+        encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+        payload["encrypt"] = True
+        payload["data"] = base64.b64encode(ciphertext).decode("utf-8")
+        payload["iv"] = base64.b64encode(iv).decode("utf-8")
+        return payload
+
+    def decrypt_old(payload: dict, devicekey: str):
+        ciphertext = base64.b64decode(payload["data"])
+        key = hashlib.md5(devicekey.encode("utf-8")).digest()
+        iv = base64.b64decode(payload["iv"])
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+        padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+        unpadder = padding.PKCS7(128).unpadder()
+        return unpadder.update(padded_data) + unpadder.finalize()
+
+    key = "9b0810bc-557a-406c-8266-614767890531"
+    params = {
+        "switches": [{"outlet": i, "switch": "on"} for i in range(4)],
+        "current_00": 12,
+        "voltage_00": 22345,
+        "actPow_00": 2345,
+    }
+    msg = encrypt({"data": params}, key)
+
+    n = 20_000
+    bench("encrypt (old)", lambda: encrypt_old({"data": params}, key), n)
+    bench("encrypt", lambda: encrypt({"data": params}, key), n)
+    bench("decrypt (old)", lambda: decrypt_old(msg, key), n)
+    bench("decrypt", lambda: decrypt(msg, key), n)
+
+
+def topology():
+    from custom_components.sonoff.core.ewelink import XRegistry
+
+    # 500 bridges with 9 children each
+    def device(deviceid: str, **params) -> dict:
+        return {
+            "deviceid": deviceid,
+            "name": deviceid,
+            "extra": {"uiid": 0},
+            "params": params,
+        }
+
+    devices = []
+    for i in range(500):
+        parentid = f"p{i:04}"
+        devices.append(device(parentid))
+        devices += [device(f"c{i:04}{j}", parentid=parentid) for j in range(9)]
+
+    # previous implementation, with linear search for each child
+    def link_old():
+        items = sorted(devices, key=lambda d: d["params"].get("parentid", ""))
+        for device in items:
+            if parentid := device["params"].get("parentid"):
+                try:
+                    device["parent"] = next(
+                        d for d in items if d["deviceid"] == parentid
+                    )
+                except StopIteration:
+                    pass
+
+    def link():
+        items = sorted(devices, key=lambda d: d["params"].get("parentid", ""))
+        index = {d["deviceid"]: d for d in items}
+        for device in items:
+            if parentid := device["params"].get("parentid"):
+                if parent := index.get(parentid):
+                    device["parent"] = parent
+
+    def setup():
+        # noinspection PyTypeChecker
+        XRegistry(None).setup_devices(devices)
+
+    print(f"{len(devices)} devices")
+    bench("link parents (old)", link_old, 1)
+    bench("link parents", link, 100)
+    bench("setup_devices", setup, 5)
+
+
+def cloud_ws():
+    import asyncio
+
+    from custom_components.sonoff.core.ewelink.base import SIGNAL_UPDATE
+    from custom_components.sonoff.core.ewelink.cloud import XRegistryCloud
+
+    # noinspection PyTypeChecker
+    cloud = XRegistryCloud(None)
+    received = []
+    cloud.dispatcher_connect(SIGNAL_UPDATE, lambda msg: received.append(msg["seq"]))
+
+    # query responses for 100 devices and one update for each
+    def messages() -> list[dict]:
+        items = [
+            {"deviceid": f"d{i:03}", "params": {"switch": "on"}, "seq": i}
+            for i in range(100)
+        ]
+        items += [
+            {"action": "update", "deviceid": f"d{i:03}", "params": {}, "seq": 100 + i}
+            for i in range(100)
+        ]
+        return items
+
+    # previous implementation, with task for each message
+    async def process_old(data: dict):
+        cloud._process_ws_msg(data)
+
+    async def run_old():
+        for data in messages():
+            _ = asyncio.create_task(process_old(data))
+        await asyncio.sleep(0)
+
+    async def run():
+        for data in messages():
+            cloud._process_ws_msg(data)
+
+    loop = asyncio.new_event_loop()
+    bench("process 200 msgs (old)", lambda: loop.run_until_complete(run_old()), 500)
+    bench("process 200 msgs", lambda: loop.run_until_complete(run()), 500)
+    loop.close()
+
+    # updates are processed right after its receiving, in the same order
+    ordered = all(received[i] == i % 200 for i in range(len(received)))
+    print(f"ordered: {ordered}")
+
+
+def json_codec():
+    import json
+
+    from custom_components.sonoff.core.ewelink import codec
+
+    payloads = {
+        # DualR3 energy history (cloud)
+        "dualr3": {
+            "deviceid": "1000123abc",
+            "params": {
+                "current_00": 12,
+                "voltage_00": 22345,
+                "actPow_00": 2345,
+                "reactPow_00": 12,
+                "apparentPow_00": 2350,
+                "kwhHistories_00": "".join(f"{i % 100:04}" for i in range(720)),
+            },
+        },
+        # SPM-Main sub device switches (LAN)
+        "spm": {
+            "subDevId": "a4800023abc",
+            "switches": [{"outlet": i, "switch": "on"} for i in range(4)],
+            "current_00": 12,
+            "voltage_00": 22345,
+            "actPow_00": 2345,
+            "uiActive": {"outlet": 0, "time": 60},
+        },
+        # NSPanel thermostat and widgets (cloud)
+        "nspanel": {
+            "action": "update",
+            "deviceid": "1000123abc",
+            "params": {
+                "temperature": 22,
+                "humidity": 50,
+                "HMI_weather": {"city": "Moscow", "weather": 1, "temp": -5},
+                "switches": [{"outlet": i, "switch": "off"} for i in range(2)],
+                "widgets": [
+                    {"type": "switch", "ctype": "device", "id": f"100{i}abcdef"}
+                    for i in range(8)
+                ],
+            },
+        },
+    }
+
+    for name, payload in payloads.items():
+        raw = json.dumps(payload).encode()
+        bench(f"{name} loads (json)", lambda: json.loads(raw), 20_000)
+        bench(f"{name} loads (codec)", lambda: codec.loads(raw), 20_000)
+        bench(f"{name} dumps (json)", lambda: json.dumps(payload).encode(), 20_000)
+        bench(f"{name} dumps (codec)", lambda: codec.dumps(payload), 20_000)
+
+
+def startup():
+    import importlib.util
+
+    from custom_components.sonoff.core import devices
+
+    name = devices.__name__
+    code = importlib.util.find_spec(name).loader.get_code(name)
+
+    def load() -> dict:
+        module = {"__name__": name, "__package__": devices.__package__}
+        exec(code, module)
+        return module
+
+    # previous implementation, classes for all UIIDs created on import
+    def load_old():
+        module = load()
+        for uiid in module["DEVICES"]:
+            module["get_spec"]({"extra": {"uiid": uiid}, "params": {}})
+
+    bench("import devices (old)", load_old, 100)
+    bench("import devices", load, 100)
+
+    # device with custom device_class on each setup
+    device_class = ["light", "fan", {"light": [3, 4]}]
+    classes = devices.get_spec({"extra": {"uiid": 4}, "params": {}})
+
+    def custom_spec_old():
+        devices.SPEC_CLASSES.clear()
+        devices.get_custom_spec(classes, device_class)
+
+    bench("custom spec (old)", custom_spec_old, 2_000)
+    bench("custom spec", lambda: devices.get_custom_spec(classes, device_class), 2_000)
+
+
+def device_state():
+    import tracemalloc
+
+    from custom_components.sonoff.core.ewelink import XDevice
+
+    n = 2_000
+
+    def raw(i: int) -> dict:
+        return {
+            "deviceid": f"1000{i:06}",
+            "name": f"Device {i}",
+            "apikey": "9b0810bc-557a-406c-8266-614767890531",
+            "brandName": "SONOFF",
+            "productModel": "MINIR4",
+            "online": True,
+            "extra": {"uiid": 1},
+            "params": {"switch": "on", "sledOnline": "on", "rssi": -50},
+            "host": "192.168.1.10:8081",
+            "localtype": "plug",
+        }
+
+    # previous implementation, hot state in the same dict
+    def setup_old() -> list:
+        devices = []
+        for i in range(n):
+            device = raw(i)
+            device["local"] = True
+            device["localfail"] = 0
+            device["localping"] = device["localrecv"] = 1000.0
+            device["local_seq"] = device["cloud_seq"] = 1
+            devices.append(device)
+        return devices
+
+    def setup() -> list:
+        devices = []
+        for i in range(n):
+            device = XDevice(raw(i))
+            device.local = True
+            device.localfail = 0
+            device.localping = device.localrecv = 1000.0
+            device.local_seq = device.cloud_seq = 1
+            devices.append(device)
+        return devices
+
+    for name, func in (("dict (old)", setup_old), ("XDevice", setup)):
+        tracemalloc.start()
+        devices = func()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{name:40} {size / len(devices):12,.0f} bytes/device")
+
+    # local message and scheduler tick for each device
+    devices_old = setup_old()
+    devices = setup()
+
+    def tick_old():
+        for device in devices_old:
+            device["local_seq"] = 2
+            device["local"] = True
+            device["localfail"] = 0
+            device["localping"] = 1059.0
+            device["localrecv"] = 1000.0
+            if device["localfail"] < 3 and 1001 >= device["localping"]:
+                pass
+
+    def tick():
+        for device in devices:
+            device.local_seq = 2
+            device.local = True
+            device.localfail = 0
+            device.localping = 1059.0
+            device.localrecv = 1000.0
+            if device.localfail < 3 and 1001 >= device.localping:
+                pass
+
+    bench(f"{n} devices tick (old)", tick_old, 500)
+    bench(f"{n} devices tick", tick, 500)
+
+    # cold metadata and dict view
+    bench(f"{n} devices params", lambda: [d["params"] for d in devices], 500)
+    bench(f"{n} devices view", lambda: [d.get("local") for d in devices], 500)
+
+
+def energy():
+    from custom_components.sonoff import sensor
+
+    # previous implementation, int() for each value
+    def decode_old(value: str) -> list | None:
+        try:
+            return [
+                round(
+                    int(value[i : i + 2], 16) + int(value[i + 2 : i + 4], 10) * 0.01, 2
+                )
+                for i in range(0, len(value), 4)
+            ]
+        except Exception:
+            return None
+
+    def decode() -> tuple:
+        sensor.decode_history.cache_clear()
+        return sensor.decode_history(history, sensor.ENERGY_DUALR3)
+
+    def decode_cached() -> tuple:
+        return sensor.decode_history(history, sensor.ENERGY_DUALR3)
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    # DualR3 history for 30 days (cloud) and for 100 days (LAN)
+    for days in (30, 100):
+        history = "".join(f"{i % 100:04}" for i in range(days * 24))
+        bench(f"decode {days} days (old)", lambda: decode_old(history), 2_000)
+
+        # None in sys.modules hides numpy from decoder
+        sys.modules["numpy"] = None
+        assert decode_old(history) == list(decode())
+        bench(f"decode {days} days", decode, 2_000)
+
+        if numpy:
+            sys.modules["numpy"] = numpy
+            assert decode_old(history) == list(decode())
+            bench(f"decode {days} days (numpy)", decode, 2_000)
+
+        bench(f"decode {days} days (cached)", decode_cached, 2_000)
+
+
+BENCHMARKS = {
+    "cloud_ws": cloud_ws,
+    "codec": json_codec,
+    "crypto": crypto,
+    "device_state": device_state,
+    "energy": energy,
+    "startup": startup,
+    "topology": topology,
+}
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:] or BENCHMARKS:
+        print(f"--- {arg}")
+        BENCHMARKS[arg]()
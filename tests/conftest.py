@@ -0,0 +1,12 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def real_asyncio(monkeypatch):
+    """Restore asyncio functions mocked by tests.init, for tests with real event
+    loop. Call tests.init inside such test will mock them again.
+    """
+    monkeypatch.setattr(asyncio, "get_running_loop", asyncio.events.get_running_loop)
+    monkeypatch.setattr(asyncio, "create_task", asyncio.tasks.create_task)
@@ -1,3 +1,7 @@
+import sys
+
+import pytest
+
 from . import DEVICEID, init
 
 
@@ -722,3 +726,44 @@ def test_powr3_energy():
         0.15,
         0.15,
     ]
+
+
+def test_decode_history(monkeypatch):
+    from custom_components.sonoff import sensor
+
+    # same decoding with and without numpy
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    sensor.decode_history.cache_clear()
+
+    assert sensor.XCloudEnergy.decode_energy("0a0102020003") == [10.12, 2.03]
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a120203") == [10.12, 2.03]
+    assert sensor.XCloudEnergyPOWR3.decode_energy("a12203") == [10.12, 2.03]
+    assert sensor.XCloudEnergyDualR3.decode_energy("FF99") == [255.99]
+
+    # wrong length, wrong digits and empty history
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a120") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a1a") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy("0g12") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a1ф") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy("") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy(None) is None
+
+    # same history string is decoded once
+    sensor.decode_history.cache_clear()
+    history = "".join(f"{i % 100:04}" for i in range(720))
+    assert sensor.XCloudEnergyDualR3.decode_energy(history)[:2] == [0.0, 0.01]
+    sensor.XCloudEnergyDualR3.decode_energy(history)
+    assert sensor.decode_history.cache_info().hits == 1
+
+
+def test_decode_history_numpy():
+    from custom_components.sonoff import sensor
+
+    pytest.importorskip("numpy")
+    sensor.decode_history.cache_clear()
+
+    assert sensor.XCloudEnergy.decode_energy("0a0102020003") == [10.12, 2.03]
+    assert sensor.XCloudEnergyPOWR3.decode_energy("a12203") == [10.12, 2.03]
+    assert sensor.XCloudEnergyDualR3.decode_energy("FF99") == [255.99]
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a1a") is None
+    assert sensor.XCloudEnergyDualR3.decode_energy("0a1ф") is None
@@ -1,4 +1,5 @@
 import asyncio
+import sys
 import time
 from typing import Union
 
@@ -28,12 +29,14 @@ from custom_components.sonoff.binary_sensor import XBinarySensor, XHumanSensor,
 from custom_components.sonoff.button import XRemoteButton, XT5Effect
 from custom_components.sonoff.climate import XClimateNS, XThermostat
 from custom_components.sonoff.core import devices
-from custom_components.sonoff.core.devices import Battery
-from custom_components.sonoff.core.entity import XEntity
+from custom_components.sonoff.core.devices import Battery, spec
+from custom_components.sonoff.core.entity import XEntity, XStateWriter
 from custom_components.sonoff.core.ewelink import (
     SIGNAL_ADD_ENTITIES,
     SIGNAL_CONNECTED,
     SIGNAL_UPDATE,
+    XDevice,
+    XRegistry,
 )
 from custom_components.sonoff.cover import XCover, XCoverDualR3, XCoverOP, XZigbeeCover
 from custom_components.sonoff.fan import XFan, XFan17, XToggleFan
@@ -2792,3 +2795,159 @@ def test_human_7055():
 
     sensor: XSensor = next(e for e in entities if e.uid == "illumination")
     assert sensor.state == 361
+
+
+def test_dispatcher():
+    # noinspection PyTypeChecker
+    registry = XRegistry(None)
+
+    calls = []
+    generic = lambda params=None: calls.append("generic")
+    power = lambda params=None: calls.append("power")
+    switch = lambda params=None: calls.append("switch")
+
+    registry.dispatcher_connect(DEVICEID, generic)
+    registry.dispatcher_connect(DEVICEID, power, {"power"})
+    disconnect = registry.dispatcher_connect(DEVICEID, switch, {"switch"})
+
+    registry.dispatcher_send(DEVICEID, {"power": 10})
+    assert calls == ["generic", "power"]
+
+    # update without params (available flag) goes to all targets
+    calls.clear()
+    registry.dispatcher_send(DEVICEID)
+    assert calls == ["generic", "power", "switch"]
+
+    calls.clear()
+    disconnect()
+    registry.dispatcher_send(DEVICEID, {"switch": "on", "power": 10})
+    registry.dispatcher_send(DEVICEID, None)
+    assert calls == ["generic", "power", "generic", "power"]
+
+
+def test_dispatcher_entities():
+    reg, entities = init({"extra": {"uiid": 5}})
+    power = next(e for e in entities if e.uid == "power")
+
+    # update with power param will wake only power sensor
+    index = reg.dispatcher_index[DEVICEID]
+    assert list(index["power"]) == [power.internal_update]
+    # connection sensor has own internal_update and receives all updates
+    assert [i.__self__.uid for i in index[None]] == ["connection"]
+
+
+def test_coalesce(monkeypatch):
+    reg, entities = init({"extra": {"uiid": 5}})
+    power = next(e for e in entities if e.uid == "power")
+
+    writes = []
+    power._async_write_ha_state = lambda: writes.append(power.state)
+
+    loop = asyncio.new_event_loop()
+    power.hass.loop = loop
+
+    monkeypatch.setattr(XEntity, "writer", XStateWriter())
+
+    # same update from LAN and cloud
+    reg.dispatcher_send(DEVICEID, {"power": 10})
+    reg.dispatcher_send(DEVICEID, {"power": 10})
+    reg.dispatcher_send(DEVICEID, {"power": 12})
+    assert writes == []
+
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    assert writes == [12]
+    assert XEntity.writer.diagnostics() == {"writes": 1, "suppressed": 2}
+
+
+def test_lazy_spec():
+    from custom_components.sonoff.core import devices
+    from custom_components.sonoff.sensor import XSensor
+
+    assert spec(XSensor, param="power", enabled=False) is spec(
+        XSensor, param="power", enabled=False
+    )
+    assert spec(XSensor, param="power") is not spec(XSensor, param="current")
+
+    classes = devices.get_spec({"extra": {"uiid": 7032}, "params": {}})
+    assert not any(isinstance(i, devices.LazySpec) for i in classes)
+    assert devices.get_spec({"extra": {"uiid": 7032}, "params": {}}) == classes
+
+    # lazy spec based on another lazy spec
+    assert classes[1].param == "power" and classes[1].multiply == 0.01
+    assert classes[0].__bases__ == (devices.XSwitches,)
+
+
+def test_platforms():
+    from custom_components.sonoff.core import devices
+    from custom_components.sonoff.sensor import XSensor
+
+    assert devices.get_platform(XSensor) == "sensor"
+    assert devices.get_platform(devices.XClimateNS) == "climate"
+    assert devices.get_platform(devices.lazy(devices.XSensor100, param="p")) == "sensor"
+
+    def platforms(uiid: int, **kwargs) -> set:
+        return devices.get_platforms({"extra": {"uiid": uiid}, **kwargs})
+
+    # switch classes can be changed to light by default_class option in other tests
+    assert platforms(1) - {"light", "switch"} == {"number", "sensor"}
+    assert platforms(126) - {"light", "switch"} == {"cover", "fan", "select", "sensor"}
+    assert platforms(133) - {"light", "switch"} == {"climate", "sensor"}
+    assert platforms(195) - {"light", "switch"} == {
+        "alarm_control_panel",
+        "button",
+        "media_player",
+        "sensor",
+    }
+    assert {"fan", "light"} <= platforms(2, device_class=["light", {"fan": 2}])
+
+    # unknown UIID - same spec as get_spec
+    spec_platforms = {devices.get_platform(cls) for cls in devices.SPEC_SWITCH}
+    assert platforms(9999, params={"switch": "on"}) == spec_platforms
+    assert "number" in spec_platforms
+    assert platforms(9999, params={}) == {"sensor"}
+
+
+def test_import_platform(monkeypatch):
+    from custom_components.sonoff.core import devices
+
+    name = "custom_components.sonoff.media_player"
+    monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.setattr(devices, "IMPORT_TIMES", {})
+
+    # import time is saved only for new module
+    cls = devices.LazySpec("media_player.XPanelBuzzer", None).resolve()
+    assert cls.__module__ == name
+    assert list(devices.IMPORT_TIMES) == ["media_player"]
+
+    devices.IMPORT_TIMES.clear()
+    assert devices.import_platform("media_player") is sys.modules[name]
+    assert devices.IMPORT_TIMES == {}
+
+
+def test_available_cache():
+    reg, entities = init(
+        {"extra": {"uiid": 4}, "params": {"switches": [], "sledOnline": "on"}}
+    )
+    assert len(entities) > 4
+
+    calls = []
+    can_cloud = reg.can_cloud
+
+    def can_cloud_count(device: XDevice) -> bool:
+        calls.append(device["deviceid"])
+        return can_cloud(device)
+
+    reg.can_cloud = can_cloud_count
+
+    # one check for all device entities, including connection sensor
+    reg.dispatcher_send(DEVICEID)
+    assert len(calls) == 1
+    assert all(e.available for e in entities)
+
+    # fresh check for each update
+    reg.devices[DEVICEID]["online"] = False
+    reg.dispatcher_send(DEVICEID)
+    assert len(calls) == 2
+    assert not any(e.available for e in entities if e.uid != "connection")
+    assert reg.available_cache is None
@@ -1,12 +1,28 @@
 import asyncio
+import base64
 import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, modes
 
 from custom_components.sonoff.core.devices import spec
-from custom_components.sonoff.core.ewelink import XDevice, XRegistry, XRegistryLocal
-from custom_components.sonoff.core.ewelink.local import decrypt, encrypt
+from custom_components.sonoff.core.ewelink import (
+    XDevice,
+    XRegistry,
+    XRegistryLocal,
+    XRoute,
+)
+from custom_components.sonoff.core.ewelink.cloud import XRegistryCloud, XTokenBucket
+from custom_components.sonoff.core.ewelink.local import (
+    XLocalPool,
+    aes_key,
+    decrypt,
+    encrypt,
+)
 from custom_components.sonoff.fan import XFan
 from custom_components.sonoff.light import XLightL1
-from . import DEVICEID, save_to
+from . import DEVICEID, init, save_to
 
 
 def test_bulk():
@@ -75,11 +91,63 @@ def test_cryptography():
     assert json.loads(raw) == params
 
 
-def test_cloud_zigbee_offline():
-    device: XDevice = {
-        "online": False,
+def test_cryptography_padding():
+    key = "9b0810bc-557a-406c-8266-614767890531"
+
+    # plaintext with exact block size gets full padding block
+    payload = encrypt({"data": "x" * 14}, key)
+    assert len(base64.b64decode(payload["data"])) == 32
+    assert decrypt(payload, key) == b'"' + b"x" * 14 + b'"'
+
+    # block without padding
+    iv = bytes(16)
+    encryptor = Cipher(aes_key(key), modes.CBC(iv)).encryptor()
+    data = encryptor.update(bytes(16)) + encryptor.finalize()
+    payload = {"data": base64.b64encode(data), "iv": base64.b64encode(iv)}
+    with pytest.raises(ValueError):
+        decrypt(payload, key)
+
+
+def test_device_dict():
+    device = XDevice({"deviceid": DEVICEID, "local": True, "localfail": 0})
+    assert dict(device) == {"deviceid": DEVICEID}
+    assert device.state() == {"local": True, "localfail": 0}
+    assert device["local"] is True and device.local is True
+
+    # unset state is same as missing dict item
+    assert "host" not in device and "localping" not in device
+    assert device.get("localping", 1.0) == 1.0 and device.get("host", "-") == "-"
+    with pytest.raises(KeyError):
+        _ = device["localping"]
+    with pytest.raises(KeyError):
+        device.pop("localping")
+    assert device.pop("localping", None) is None
+
+    # dict methods store hot keys in slots
+    device.update({"localrecv": 123.0, "host": "192.168.1.10"}, local_seq=1)
+    assert device.setdefault("cloud_seq", 2) == 2
+    assert device.setdefault("cloud_seq", 3) == 2
+    assert device.setdefault("name", "Device1") == "Device1"
+    assert dict(device) == {
+        "deviceid": DEVICEID,
+        "host": "192.168.1.10",
+        "name": "Device1",
+    }
+    assert device.localrecv == 123.0 and device.local_seq == 1
+
+    assert device.pop("local") is True
+    assert "local" not in device and device.local is None
+    assert device.state() == {
+        "cloud_seq": 2,
+        "local_seq": 1,
+        "localfail": 0,
+        "localrecv": 123.0,
     }
 
+
+def test_cloud_zigbee_offline():
+    device = XDevice(online=False)
+
     # noinspection PyTypeChecker
     registry: XRegistry = XRegistry(None)
     registry.devices = {DEVICEID: device}
@@ -89,3 +157,822 @@ def test_cloud_zigbee_offline():
 
     registry.cloud_update({"deviceid": DEVICEID, "params": {"temperature": 0}})
     assert registry.devices[DEVICEID]["online"] is True
+
+
+def test_local_keepalive(real_asyncio):
+    from aiohttp import web
+
+    async def handler(request: web.Request):
+        return web.json_response({"error": 0})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/zeroconf/{command}", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        local = XRegistryLocal(None)
+        local.keepalive = True
+        local.pool = XLocalPool()
+
+        device: XDevice = {"deviceid": DEVICEID, "host": f"127.0.0.1:{port}"}
+        try:
+            assert await local.send(device) == "online"
+            assert await local.send(device, {"switch": "on"}) == "online"
+        finally:
+            await local.pool.close()
+            await runner.cleanup()
+
+        return local.pool.stats[DEVICEID]
+
+    stats = asyncio.run(run())
+    assert stats["connect"] == 1
+    assert stats["reuse"] == 1
+
+
+def test_local_queue(real_asyncio):
+    calls = []
+
+    async def _send(device, params, command, *args):
+        calls.append(command)
+        await asyncio.sleep(0.01)
+        return "online"
+
+    local = XRegistryLocal(None)
+    local._send = _send
+    device: XDevice = {"deviceid": DEVICEID}
+
+    async def run():
+        return await asyncio.gather(
+            local.send(device, command="sledonline", background=True),
+            local.send(device, background=True),
+            local.send(device, background=True),
+            local.send(device, {"switch": "on"}),
+        )
+
+    assert asyncio.run(run()) == ["online"] * 4
+    # user command before background getState, two getState merged into one
+    assert calls == ["sledonline", "switch", "getState"]
+
+    stats = local.diagnostics()["queue"][DEVICEID]
+    assert stats["total"] == 3 and stats["merged"] == 1 and stats["depth"] == 0
+
+
+def test_local_queue_timeout(real_asyncio):
+    timeouts = []
+
+    async def _send(device, params, command, sequence, timeout):
+        timeouts.append((command, timeout))
+        await asyncio.sleep(0.3 if command == "getState" else 0.01)
+        return "online"
+
+    local = XRegistryLocal(None)
+    local._send = _send
+    device: XDevice = {"deviceid": DEVICEID}
+
+    async def run():
+        ts = time.monotonic()
+        # slow background request ahead of user commands
+        state = asyncio.create_task(local.send(device, background=True))
+        await asyncio.sleep(0)
+        # timeout covers waiting in the queue
+        ok1, ok2 = await asyncio.gather(
+            local.send(device, {"switch": "on"}, timeout=0.1),
+            local.send(device, {"switch": "off"}, timeout=1),
+        )
+        assert time.monotonic() - ts < 0.5
+        return ok1, ok2, await state
+
+    assert asyncio.run(run()) == ("timeout", "online", "online")
+    assert [i[0] for i in timeouts] == ["getState", "switch"]
+    # only time left after waiting
+    assert 0.6 < timeouts[1][1] < 0.8
+
+    stats = local.diagnostics()["queue"][DEVICEID]
+    assert stats["depth"] == 0
+
+
+def test_hedged_send(real_asyncio):
+    calls = []
+
+    async def local_send(device, params, command, sequence, timeout=5):
+        calls.append(("local", sequence, timeout))
+        try:
+            await asyncio.sleep(0.5)
+        except asyncio.CancelledError:
+            return "E#COS"  # same as XRegistryLocal._send
+        return "timeout"
+
+    async def cloud_send(device, params=None, sequence=None, timeout=5):
+        calls.append(("cloud", sequence))
+        return "online"
+
+    # noinspection PyTypeChecker
+    registry = XRegistry(None)
+    registry.hedged = True
+    registry.cloud.online = True
+    registry.local.online = True
+    registry.local.send = local_send
+    registry.cloud.send = cloud_send
+
+    device = XDevice(deviceid=DEVICEID, online=True, local=True)
+
+    route = registry.route(device)
+    route.local.add(True, 0.01)
+
+    async def run():
+        params = {"switch": "on"}
+        ok = await registry.send_hedged(
+            route, device, device, params, None, None, "123", 2
+        )
+        await asyncio.sleep(0.01)  # finish cancelled LAN request
+        return ok
+
+    assert asyncio.run(run()) == "cloud"
+    # cloud command with same sequence after short delay
+    assert calls == [("local", "123", 2), ("cloud", "123")]
+    # cancelled LAN request isn't a LAN fail
+    assert route.local.ok == 1.0 and route.cloud.ok == 1.0
+
+
+def test_route():
+    route = XRoute()
+    assert route.local_first() and route.local_timeout() == 1
+
+    for _ in range(20):
+        route.local.add(True, 0.03)
+        route.cloud.add(True, 0.3)
+    assert route.local_first()
+    assert route.local.percentile(0.95) == 0.05
+    assert route.local_timeout() == 0.5
+
+    # unstable LAN
+    for _ in range(5):
+        route.local.add(False, 1)
+    assert not route.local_first()
+
+    # fast LAN again
+    for _ in range(10):
+        route.local.add(True, 0.03)
+    assert route.local_first()
+
+
+def test_schedule():
+    # noinspection PyTypeChecker
+    registry = XRegistry(None)
+
+    pings = []
+    registry.update_local = lambda device, ts: pings.append(device["deviceid"]) or (
+        ts + 3600
+    )
+
+    for i in range(100):
+        did = f"dev{i:03}"
+        registry.devices[did] = XDevice(deviceid=did, local=True)
+        registry.schedule(registry.devices[did], 1000 + i * 10)
+
+    # only devices with deadline are processed
+    assert registry.run_scheduled(1095) <= 5
+    assert pings == [f"dev{i:03}" for i in range(10)]
+
+    # earlier deadline replaces later one, stale heap entry is skipped
+    pings.clear()
+    registry.ping_now(registry.devices["dev050"])
+    assert registry.devices["dev050"]["localping"] == 0
+    registry.run_scheduled(1095)
+    assert pings == ["dev050"]
+
+    pings.clear()
+    registry.run_scheduled(3000)
+    assert len(pings) == 89 and "dev050" not in pings
+    assert len(registry.schedule_due) == 100
+
+
+def test_topology():
+    parent = {"deviceid": "parent", "extra": {"uiid": 128}}
+    devices = [
+        {"deviceid": f"child{i}", "params": {"parentid": "parent"}}
+        for i in range(4)
+    ]
+    reg, _ = init(devices + [parent])
+
+    assert list(reg.children["parent"]) == [f"child{i}" for i in range(4)]
+    assert reg.devices["child0"]["parent"] is reg.devices["parent"]
+    assert not reg.schedule_due
+
+    # children are polled only after SPM-Main was found in LAN
+    msg = {"deviceid": "parent", "host": "192.168.1.2", "localtype": "meter"}
+    reg.local_update({**msg, "params": {"switches": []}})
+    assert set(reg.schedule_due) == {"parent", "child0", "child1", "child2", "child3"}
+
+    # parent can be already known registry device
+    child = {
+        "deviceid": "child4",
+        "name": "Child4",
+        "online": True,
+        "params": {"parentid": "parent"},
+        "extra": {"uiid": 0},
+    }
+    reg.setup_devices([child])
+    assert reg.devices["child4"]["parent"] is reg.devices["parent"]
+    assert len(reg.children["parent"]) == 5
+
+    # child after SPM-Main was found in LAN is polled too
+    assert "child4" in reg.schedule_due
+    assert reg.parents["child4"] == "parent"
+
+    # children are local with SPM-Main
+    reg.local.online = True
+    assert reg.can_local(reg.devices["child4"])
+    reg.devices["parent"].local = False
+    assert not reg.can_local(reg.devices["child4"])
+
+    assert reg.remove_device("parent")
+    assert "child4" not in reg.parents
+
+
+def test_duplicates():
+    reg, entities = init({"extra": {"uiid": 5}})
+    reg.devices[DEVICEID]["host"] = "192.168.1.2"
+
+    updates = []
+    reg.dispatcher_connect(DEVICEID, lambda params=None: updates.append(params))
+
+    msg = {"deviceid": DEVICEID, "host": "192.168.1.2", "localtype": "plug"}
+
+    # LAN update and mDNS repeat with same seq
+    reg.local_update({**msg, "seq": 1, "params": {"switch": "on"}})
+    reg.local_update({**msg, "seq": 1, "params": {"switch": "on"}})
+    # same update from cloud
+    reg.cloud_update({"deviceid": DEVICEID, "params": {"switch": "on"}})
+    assert updates == [{"switch": "on"}, None]  # None - device became local
+
+    # LAN message for the same change can come after the cloud one
+    reg.cloud_update({"deviceid": DEVICEID, "params": {"switch": "off"}})
+    reg.local_update({**msg, "seq": 2, "params": {"switch": "off"}})
+    assert updates[2:] == [{"switch": "off"}]
+
+    # new LAN updates with new seq
+    reg.local_update({**msg, "seq": 3, "params": {"switch": "on"}})
+    reg.local_update({**msg, "seq": 4, "params": {"switch": "on"}})
+    assert updates[3:] == [{"switch": "on"}, {"switch": "on"}]
+
+    # same state from LAN after cloud copy matched the previous one
+    updates.clear()
+    reg.local_update({**msg, "seq": 5, "params": {"switch": "off"}})
+    reg.cloud_update({"deviceid": DEVICEID, "params": {"switch": "off"}})
+    reg.local_update({**msg, "seq": 6, "params": {"switch": "off"}})
+    assert updates == [{"switch": "off"}, {"switch": "off"}]
+
+    # events are never merged between transports: app command with cloud echo
+    # and physical press with the same params
+    updates.clear()
+    reg.cloud_update({"deviceid": DEVICEID, "params": {"key": 0}})
+    reg.local_update({**msg, "seq": 7, "params": {"key": 0}})
+    reg.cloud_update({"deviceid": DEVICEID, "params": {"rfTrig0": "2024"}})
+    reg.local_update({**msg, "seq": 8, "params": {"rfTrig0": "2024"}})
+    assert len(updates) == 4
+
+    assert reg.diagnostics()["duplicates"] == 4
+
+
+def test_cloud_waiter(real_asyncio, monkeypatch):
+    # other tests can replace time.time with constant
+    monkeypatch.setattr(time, "time", time.monotonic)
+
+    # noinspection PyTypeChecker
+    cloud = XRegistryCloud(None)
+    cloud.auth = {"user": {"apikey": "123"}}
+    cloud.max_waiters = 2
+
+    class WS:
+        @staticmethod
+        async def send_json(payload: dict):
+            # response can come before send_json returns
+            if payload["params"] == {"switch": "on"}:
+                cloud._set_response(payload["sequence"], 0)
+
+    cloud.ws = WS()
+    device: XDevice = {"deviceid": DEVICEID, "apikey": "123"}
+
+    async def run():
+        ok1 = await cloud.send(device, {"switch": "on"}, "1")
+        tasks = [
+            asyncio.create_task(cloud.send(device, {"switch": "off"}, str(i), 1))
+            for i in range(2, 5)
+        ]
+        return [ok1] + sorted(await asyncio.gather(*tasks))
+
+    loop = asyncio.new_event_loop()
+    monkeypatch.setattr(asyncio, "create_task", loop.create_task)
+    assert loop.run_until_complete(run()) == ["online", "E#BSY", "timeout", "timeout"]
+    loop.close()
+
+    stats = cloud.diagnostics()
+    assert stats["pending"] == 0 and stats["timeouts"] == 2
+    assert stats["responses"]["hist"][0] == 1
+
+
+def test_token_bucket(real_asyncio):
+    bucket = XTokenBucket(100, 2)
+    order = []
+
+    async def request(name: str, background: bool):
+        await bucket.acquire(background)
+        order.append(name)
+
+    async def run():
+        tasks = [asyncio.create_task(request(f"bg{i}", True)) for i in range(3)]
+        tasks += [asyncio.create_task(request(f"user{i}", False)) for i in range(3)]
+        await asyncio.gather(*tasks)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run())
+    loop.close()
+
+    # burst for first requests, then user requests before background
+    assert order == ["bg0", "bg1", "user0", "user1", "user2", "bg2"]
+    stats = bucket.diagnostics()
+    assert stats["total"] == 6 and stats["queue"] == [0, 0]
+    assert 0.03 < stats["wait_max"] < 0.2
+
+
+def test_token_bucket_config():
+    import voluptuous as vol
+
+    from custom_components.sonoff import CONFIG_SCHEMA
+
+    config = CONFIG_SCHEMA(
+        {"sonoff": {"cloud_rate": "0.5", "cloud_burst": 1, "cloud_page": "30"}}
+    )
+    assert config["sonoff"] == {"cloud_rate": 0.5, "cloud_burst": 1, "cloud_page": 30}
+
+    # zero rate and zero burst will block cloud commands forever
+    for conf in (
+        {"cloud_rate": 0},
+        {"cloud_burst": 0},
+        {"cloud_rate": -1},
+        {"cloud_page": -1},
+    ):
+        with pytest.raises(vol.Invalid):
+            CONFIG_SCHEMA({"sonoff": conf})
+
+
+def test_sync_devices():
+    reg, entities = init({"extra": {"uiid": 1}, "params": {"switch": "off"}})
+    switch = next(e for e in entities if e.uid is None)
+    assert switch.state == "off"
+
+    devices = [
+        {
+            "deviceid": DEVICEID,
+            "name": "Device1",
+            "online": True,
+            "extra": {"uiid": 1},
+            "params": {"switch": "on"},
+        },
+        {
+            "deviceid": "1000123def",
+            "name": "Device2",
+            "online": True,
+            "extra": {"uiid": 1},
+            "params": {"switch": "off"},
+        },
+    ]
+
+    # only new device will be setup
+    new = reg.sync_devices(devices)
+    assert {e.device["deviceid"] for e in new} == {"1000123def"}
+
+    # known device updated with new params
+    assert switch.state == "on"
+    assert reg.devices[DEVICEID] is switch.device
+
+    def sync(use_params: bool = True, **kwargs):
+        device = {**devices[0], "params": {"switch": "off"}, **kwargs}
+        reg.sync_devices([device], use_params)
+
+    # cloud params don't overwrite state of LAN device and cloud offline device
+    reg.devices[DEVICEID].local = True
+    sync(name="Device3")
+    assert switch.state == "on"
+    # but metadata is updated
+    assert reg.devices[DEVICEID]["name"] == "Device3"
+
+    reg.devices[DEVICEID].local = False
+    sync(online=False)
+    assert switch.state == "on"
+
+    # and in local mode
+    sync(use_params=False)
+    assert switch.state == "on"
+
+    sync()
+    assert switch.state == "off"
+
+
+def test_get_devices(real_asyncio):
+    homes = {
+        "home1": [{"deviceid": f"d{i}"} for i in range(5)] + [{"groupid": "g1"}],
+        "home2": [{"deviceid": "d0"}, {"deviceid": "d5"}],  # shared device
+    }
+    totals = {}
+    requests = []
+
+    class Response:
+        def __init__(self, params: dict):
+            things = homes[params["familyid"]]
+            total = totals.get(params["familyid"], len(things))
+            i = params.get("beginIndex", 0)
+            if num := params["num"]:
+                page = things[i : i + num]
+            else:
+                page = things
+            self.data = {
+                "error": 0,
+                "data": {
+                    "thingList": [{"itemData": item} for item in page],
+                    "total": total,
+                },
+            }
+
+        async def json(self):
+            return self.data
+
+    class Session:
+        @staticmethod
+        async def get(url, headers, timeout, params):
+            requests.append(params)
+            await asyncio.sleep(0)
+            return Response(params)
+
+    # noinspection PyTypeChecker
+    cloud = XRegistryCloud(Session())
+    cloud.region = "eu"
+    cloud.auth = {"at": "token"}
+
+    loop = asyncio.new_event_loop()
+    devices = loop.run_until_complete(cloud.get_devices(["home1", "home2"]))
+    assert [i["deviceid"] for i in devices] == ["d0", "d1", "d2", "d3", "d4", "d5"]
+    assert len(requests) == 2
+
+    cloud.get_devices_page = 4
+    requests.clear()
+    devices = loop.run_until_complete(cloud.get_devices(["home1", "home2"]))
+    assert len(devices) == 6
+    assert len(requests) == 3
+
+    # full page - load next page even if total from the cloud is wrong
+    homes["home1"] = [{"deviceid": f"d{i}"} for i in range(9)]
+    totals["home1"] = 4
+    requests.clear()
+    devices = loop.run_until_complete(cloud.get_devices(["home1"]))
+    assert len(devices) == 9
+    assert [i.get("beginIndex") for i in requests] == [None, 4, 8]
+
+    # exact page - one more empty page
+    homes["home1"] = homes["home1"][:8]
+    requests.clear()
+    devices = loop.run_until_complete(cloud.get_devices(["home1"]))
+    assert len(devices) == 8
+    assert len(requests) == 3
+    loop.close()
+
+
+def test_devices_diff():
+    from custom_components.sonoff import internal_devices_diff
+
+    old = [
+        {"deviceid": "d1", "name": "Device1", "params": {"switch": "on"}},
+        {"deviceid": "d2", "name": "Device2", "params": {}},
+    ]
+    new = [
+        {"deviceid": "d1", "name": "Device1", "params": {"switch": "off"}},
+        {"deviceid": "d2", "name": "Kitchen", "params": {}},
+        {"deviceid": "d3", "name": "Device3", "params": {}},
+    ]
+    assert internal_devices_diff(old, new) == ({"d3"}, set(), {"d2"})
+    assert internal_devices_diff(new, old[:1]) == (set(), {"d2", "d3"}, set())
+    assert not any(internal_devices_diff(old, old))
+
+
+def test_save_devices(real_asyncio):
+    from custom_components.sonoff import MISSING_DEVICES, internal_save_devices
+
+    class Store:
+        data = None
+
+        async def async_load(self):
+            return self.data
+
+        async def async_save(self, data):
+            self.data = data
+
+        def async_delay_save(self, func, delay):
+            self.data = func()
+
+    store = Store()
+    devices = [{"deviceid": "d1", "name": "Device1"}, {"deviceid": "d2"}]
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(internal_save_devices(store, devices)) == (
+        {"d1", "d2"},
+        set(),
+        set(),
+    )
+
+    # never trust empty list
+    assert not any(loop.run_until_complete(internal_save_devices(store, [])))
+    assert store.data == devices
+
+    # device is removed only after several syncs without it
+    for _ in range(2):
+        diff = loop.run_until_complete(internal_save_devices(store, devices[:1]))
+        assert not any(diff)
+    assert MISSING_DEVICES == {"d2": 2}
+
+    # device is back - counter reset
+    loop.run_until_complete(internal_save_devices(store, devices))
+    assert MISSING_DEVICES == {}
+
+    for _ in range(2):
+        loop.run_until_complete(internal_save_devices(store, devices[:1]))
+    diff = loop.run_until_complete(internal_save_devices(store, devices[:1]))
+    assert diff == (set(), {"d2"}, set())
+    assert store.data == devices[:1]
+    assert MISSING_DEVICES == {}
+
+    # params are not in diff, but saved to cache too
+    devices = [{"deviceid": "d1", "name": "Device1", "params": {"switch": "on"}}]
+    assert not any(loop.run_until_complete(internal_save_devices(store, devices)))
+    devices[0].pop("params")  # sync_devices pops params
+    assert store.data[0]["params"] == {"switch": "on"}
+    loop.close()
+
+
+def test_forward_platforms(monkeypatch):
+    from homeassistant.config_entries import ConfigEntryState
+
+    from custom_components.sonoff import (
+        DOMAIN,
+        LOADED_PLATFORMS,
+        internal_forward_platforms,
+    )
+    from custom_components.sonoff.core.devices import get_platform
+    from custom_components.sonoff.core.ewelink import SIGNAL_ADD_ENTITIES
+
+    reg, entities = init({"extra": {"uiid": 1}, "params": {"switch": "on"}})
+    monkeypatch.setattr(asyncio, "create_task", asyncio.tasks.create_task)
+    number = next(e for e in entities if get_platform(type(e)) == "number")
+
+    forwarded = []
+    added = []
+
+    class ConfigEntries:
+        @staticmethod
+        async def async_forward_entry_setups(entry, platforms: list):
+            forwarded.append(platforms.copy())
+            await asyncio.sleep(0)
+            if platforms == ["number"]:
+                reg.dispatcher_connect(SIGNAL_ADD_ENTITIES, added.extend)
+
+    class Hass:
+        data = {DOMAIN: {"entry1": reg}}
+        config_entries = ConfigEntries()
+
+    class ConfigEntry:
+        entry_id = "entry1"
+        state = ConfigEntryState.LOADED
+
+        def __init__(self):
+            self.setup_lock = asyncio.Lock()
+            self.on_unload = []
+
+        def async_on_unload(self, func):
+            self.on_unload.append(func)
+
+    async def test():
+        # noinspection PyTypeChecker
+        entry = ConfigEntry()
+        async with entry.setup_lock:  # entry setup in progress
+            # noinspection PyTypeChecker
+            await internal_forward_platforms(Hass(), entry, [])
+            assert "number" not in forwarded[0]
+
+            reg.dispatcher_send(SIGNAL_ADD_ENTITIES, [number])
+            await asyncio.sleep(0)
+            reg.dispatcher_send(SIGNAL_ADD_ENTITIES, [number])
+
+            # loads only after entry setup, but unloads with entry
+            assert len(forwarded) == 1
+            assert "number" in LOADED_PLATFORMS["entry1"]
+
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        assert forwarded[1:] == [["number"]]
+        assert added == [number, number]  # pending entities are not lost
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(test())
+    loop.close()
+    LOADED_PLATFORMS.pop("entry1")
+
+
+def test_remove_device():
+    parent = {"deviceid": "parent", "extra": {"uiid": 128}}
+    child = {"deviceid": "child", "params": {"parentid": "parent"}}
+    reg, entities = init([child, parent])
+    assert "child" in reg.dispatcher
+
+    assert reg.remove_device("child")
+    assert "child" not in reg.devices and "child" not in reg.dispatcher
+    assert reg.children["parent"] == {}
+    assert not reg.remove_device("child")
+
+    # removed entities don't listen parent updates
+    for entity in entities:
+        if entity.device["deviceid"] == "child":
+            entity.add_to_platform_abort()
+    handlers = reg.dispatcher["parent"]
+    assert all(h.__self__.device["deviceid"] == "parent" for h in handlers)
+
+
+def test_probe_hosts(real_asyncio):
+    reg, _ = init(
+        [
+            {"deviceid": "d1", "extra": {"uiid": 1}},
+            {"deviceid": "d2", "extra": {"uiid": 1}},
+            {"deviceid": "d3", "extra": {"uiid": 1}, "host": "192.168.1.30"},
+        ]
+    )
+    reg.local.online = True
+
+    async def local_send(device, params=None, command=None, **kwargs):
+        return "online" if device["host"] == "192.168.1.10:8081" else "timeout"
+
+    reg.local.send = local_send
+
+    hosts = {
+        "d1": {"host": "192.168.1.10:8081", "localtype": "plug"},
+        "d2": {"host": "192.168.1.20:8081", "localtype": "plug"},
+        "d3": {"host": "192.168.1.31:8081", "localtype": "plug"},  # from config
+        "d4": {"host": "192.168.1.40:8081", "localtype": "plug"},  # unknown
+    }
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(reg.probe_hosts(hosts))
+    loop.close()
+
+    assert reg.can_local(reg.devices["d1"])
+    assert not reg.can_local(reg.devices["d2"])
+    assert reg.devices["d3"]["host"] == "192.168.1.30"
+    assert set(reg.schedule_due) == {"d1", "d2"}
+
+    assert reg.local_hosts() == {
+        "d1": {"host": "192.168.1.10:8081", "localtype": "plug"},
+        "d2": {"host": "192.168.1.20:8081", "localtype": "plug"},
+        "d3": {"host": "192.168.1.30", "localtype": None},
+    }
+
+
+def test_probe_hosts_children(real_asyncio):
+    parent = {"deviceid": "p", "extra": {"uiid": 128}}
+    child = {"deviceid": "c", "extra": {"uiid": 0}, "params": {"parentid": "p"}}
+    reg, _ = init([parent, child])
+    reg.local.online = True
+
+    async def local_send(device, params=None, command=None, **kwargs):
+        return "online"
+
+    reg.local.send = local_send
+
+    hosts = {"p": {"host": "192.168.1.10:8081", "localtype": "meter"}}
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(reg.probe_hosts(hosts))
+    loop.close()
+
+    # children are polled after SPM-Main was found with cached host
+    assert set(reg.schedule_due) == {"p", "c"}
+
+    # zeroconf message with same host doesn't change anything
+    msg = {"deviceid": "p", "host": "192.168.1.10:8081", "localtype": "meter"}
+    reg.local_update({**msg, "params": {"switches": []}})
+    assert set(reg.schedule_due) == {"p", "c"}
+
+
+def test_zeroconf_coalesce(real_asyncio, monkeypatch):
+    from zeroconf import ServiceStateChange
+
+    # noinspection PyTypeChecker
+    local = XRegistryLocal(None)
+
+    resolved = []
+
+    async def resolve(zeroconf, service_type, name):
+        resolved.append(name)
+        await asyncio.sleep(0.01)
+
+    local._resolve = resolve
+
+    service = "_ewelink._tcp.local."
+    names = [f"eWeLink_100000000{i}.{service}" for i in range(2)]
+
+    async def run():
+        for _ in range(5):
+            for name in names:
+                local._handler1(None, service, name, ServiceStateChange.Updated)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+
+    loop = asyncio.new_event_loop()
+    monkeypatch.setattr(asyncio, "create_task", loop.create_task)
+    loop.run_until_complete(run())
+    loop.close()
+
+    # one resolving for first event and one for all events during it
+    assert sorted(resolved) == sorted(names * 2)
+    assert local.zeroconf["events"] == 10 and local.zeroconf["merged"] == 8
+    assert not local.resolving
+
+
+def test_discovery(real_asyncio, tmp_path):
+    from aiohttp import ClientSession, web
+
+    from custom_components.sonoff.core.ewelink.base import SIGNAL_UPDATE
+    from custom_components.sonoff.core.ewelink.discovery import discovery_hosts
+
+    # fake DIY device and some other web server
+    async def get_state(request: web.Request):
+        assert (await request.json())["data"] == {}
+        return web.json_response(
+            {"seq": 5, "error": 0, "deviceid": "d1", "data": {"switch": "on"}}
+        )
+
+    async def not_found(request: web.Request):
+        return web.Response(status=404, text="Not Found")
+
+    msgs = []
+
+    async def run() -> int:
+        hosts = []
+        runners = []
+        for handler in (get_state, not_found):
+            app = web.Application()
+            app.router.add_post("/zeroconf/getState", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            runners.append(runner)
+            port = site._server.sockets[0].getsockname()[1]
+            hosts.append(f"127.0.0.1:{port}")
+
+        # closed port
+        hosts.append("127.0.0.1:1")
+
+        async with ClientSession() as session:
+            local = XRegistryLocal(session)
+            local.dispatcher_connect(SIGNAL_UPDATE, msgs.append)
+            found = await local.discover(hosts, timeout=1)
+
+        for runner in runners:
+            await runner.cleanup()
+
+        assert local.discovery == {"probes": 3, "found": 1}
+        return found
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(run()) == 1
+    loop.close()
+
+    assert len(msgs) == 1
+    assert msgs[0]["deviceid"] == "d1"
+    assert msgs[0]["host"].startswith("127.0.0.1:")
+    assert msgs[0]["params"] == {"switch": "on"}
+
+    # new device can't be setup without type from zeroconf
+    reg, _ = init({})
+    reg.local_update(msgs[0])
+    assert "d1" not in reg.devices
+
+    # known device gets host and params
+    reg, entities = init({"deviceid": "d1", "extra": {"uiid": 1}})
+    reg.local_update(msgs[0])
+    assert reg.devices["d1"]["host"] == msgs[0]["host"]
+    assert reg.devices["d1"].local
+    assert reg.devices["d1"]["params"]["switch"] == "on"
+
+    arp = tmp_path / "arp"
+    arp.write_text(
+        "IP address  HW type  Flags  HW address  Mask  Device\n"
+        "192.168.1.50     0x1         0x2         aa:bb:cc:dd:ee:ff     *        eth0\n"
+        "192.168.1.51     0x1         0x0         00:00:00:00:00:00     *        eth0\n"
+        "192.168.2.10     0x1         0x2         aa:bb:cc:dd:ee:00     *        eth0\n"
+    )
+    hosts = discovery_hosts(["192.168.1.48/30", "arp", "10.0.0.0/8", "wrong"], arp)
+    assert hosts == ["192.168.1.49", "192.168.1.50", "192.168.2.10"]